@@ -5,7 +5,7 @@
     "name": "Automation Oca",
     "summary": """
         Automate actions in threaded models""",
-    "version": "16.0.1.1.1",
+    "version": "16.0.1.2.0",
     "license": "AGPL-3",
     "category": "Automation",
     "author": "Dixmit,Odoo Community Association (OCA)",
@@ -16,8 +16,10 @@
         "security/ir.model.access.csv",
         "views/menu.xml",
         "wizards/automation_configuration_test.xml",
+        "wizards/automation_configuration_estimate.xml",
         "views/automation_record.xml",
         "views/automation_record_step.xml",
+        "views/automation_step_stat_daily.xml",
         "views/automation_configuration_step.xml",
         "views/automation_configuration.xml",
         "views/link_tracker_clicks.xml",
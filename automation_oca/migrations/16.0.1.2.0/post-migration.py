@@ -0,0 +1,19 @@
+# Copyright 2024 Dixmit
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import SUPERUSER_ID, api
+
+
+def migrate(cr, version):
+    env = api.Environment(cr, SUPERUSER_ID, {})
+    # Count the statistics of the existing configurations
+    env["automation.configuration.stat"]._reconcile()
+    # Message-IDs are stored without surrounding whitespace, so they match
+    # the references of bounces and replies
+    cr.execute(
+        r"""
+        UPDATE automation_record_step
+        SET message_id = regexp_replace(message_id, '^\s+|\s+$', '', 'g')
+        WHERE message_id ~ '^\s|\s$'
+        """
+    )
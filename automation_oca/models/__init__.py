@@ -1,7 +1,10 @@
+from . import automation_cron_mixin
 from . import automation_configuration
+from . import automation_configuration_stat
 from . import automation_configuration_step
 from . import automation_record
 from . import automation_record_step
+from . import automation_step_stat_daily
 from . import mail_mail
 from . import mail_thread
 from . import link_tracker
@@ -1,9 +1,16 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from collections import defaultdict
+import logging
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-from odoo import _, api, fields, models
+from dateutil.relativedelta import relativedelta
+
+from odoo import _, api, fields, models, tools
 from odoo.exceptions import ValidationError
 from odoo.tools.safe_eval import (
     datetime as safe_datetime,
@@ -12,12 +19,24 @@ from odoo.tools.safe_eval import (
     time as safe_time,
 )
 
+from .automation_configuration_stat import STAT_FIELDS
+
+_logger = logging.getLogger(__name__)
+
+# Domains using these names must be evaluated each time
+DOMAIN_CONTEXT_NAMES_RE = re.compile(r"\b(ref|user|time|datetime|dateutil)\b")
+# First key of the advisory locks taken while running a configuration
+RUN_LOCK_KEY = zlib.crc32(b"automation.configuration") & 0x7FFFFFFF
+# Overlap between two incremental scans, for the records written by
+# transactions that were not committed yet when the previous scan started
+SCAN_MARGIN = timedelta(hours=1)
+
 
 class AutomationConfiguration(models.Model):
 
     _name = "automation.configuration"
     _description = "Automation Configuration"
-    _inherit = ["mail.thread"]
+    _inherit = ["mail.thread", "automation.cron.mixin"]
 
     name = fields.Char(required=True)
     active = fields.Boolean(default=True)
@@ -61,11 +80,28 @@ class AutomationConfiguration(models.Model):
         "ir.model.fields",
         domain="[('model_id', '=', model_id), "
         "('ttype', 'in', ['char', 'selection', 'integer', 'text', 'many2one'])]",
-        help="Used to avoid duplicates",
+        help="Used to avoid duplicates. Records without a value are always "
+        "enrolled, as they cannot be compared.",
     )
     is_periodic = fields.Boolean(
         help="Mark it if you want to make the execution periodic"
     )
+    realtime_enrollment = fields.Boolean(
+        string="Real time enrollment",
+        help="Enroll the records as soon as they are created or modified, "
+        "without waiting for the periodic execution.",
+    )
+    incremental_enrollment = fields.Boolean(
+        help="Only look for records created or modified since the last execution. "
+        "A full scan is still done periodically in order to find the records "
+        "matching time dependent filters."
+    )
+    full_scan_interval = fields.Integer(
+        default=24, help="Hours between two full scans on incremental enrollment"
+    )
+    last_scan_date = fields.Datetime(readonly=True, copy=False)
+    last_full_scan_date = fields.Datetime(readonly=True, copy=False)
+    last_scan_domain = fields.Char(readonly=True, copy=False)
     # The idea of flow of states will be:
     # draft -> run       -> done -> draft (for periodic execution)
     #       -> on demand -> done -> draft (for on demand execution)
@@ -88,14 +124,59 @@ class AutomationConfiguration(models.Model):
         inverse_name="configuration_id",
         domain=[("parent_id", "=", False)],
     )
-    record_test_count = fields.Integer(compute="_compute_record_test_count")
-    record_count = fields.Integer(compute="_compute_record_count")
-    record_done_count = fields.Integer(compute="_compute_record_count")
-    record_run_count = fields.Integer(compute="_compute_record_count")
-    activity_mail_count = fields.Integer(compute="_compute_activity_count")
-    activity_action_count = fields.Integer(compute="_compute_activity_count")
-    click_count = fields.Integer(compute="_compute_click_count")
-    next_execution_date = fields.Datetime(compute="_compute_next_execution_date")
+    record_test_count = fields.Integer(compute="_compute_stats")
+    record_count = fields.Integer(compute="_compute_stats")
+    record_done_count = fields.Integer(compute="_compute_stats")
+    record_run_count = fields.Integer(compute="_compute_stats")
+    activity_mail_count = fields.Integer(compute="_compute_stats")
+    activity_action_count = fields.Integer(compute="_compute_stats")
+    click_count = fields.Integer(compute="_compute_stats")
+    execution_interval = fields.Integer(
+        default=6, help="Time between two executions of a periodic configuration"
+    )
+    execution_interval_type = fields.Selection(
+        [("minutes", "Minutes"), ("hours", "Hours"), ("days", "Days")],
+        required=True,
+        default="hours",
+    )
+    next_execution_date = fields.Datetime(readonly=True, copy=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        self.env["automation.configuration.stat"]._reconcile(records.ids)
+        if records.filtered("realtime_enrollment"):
+            self._get_realtime_configuration_ids.clear_cache(self)
+        return records
+
+    def write(self, vals):
+        if "field_id" in vals:
+            # The stored keys must be refreshed for all the records
+            vals = dict(vals, last_full_scan_date=False)
+        realtime = bool(self.filtered("realtime_enrollment"))
+        last_execution_dates = {}
+        if {"execution_interval", "execution_interval_type"} & set(vals):
+            last_execution_dates = self._get_last_execution_dates()
+        result = super().write(vals)
+        if set(vals) & {"realtime_enrollment", "state", "model_id", "active"} and (
+            realtime or self.filtered("realtime_enrollment")
+        ):
+            self._get_realtime_configuration_ids.clear_cache(self)
+        for record in self.browse(list(last_execution_dates)):
+            record.next_execution_date = (
+                last_execution_dates[record.id] + record._get_execution_interval()
+            )
+            self.env.ref("automation_oca.cron_configuration_run")._trigger(
+                record.next_execution_date
+            )
+        return result
+
+    def unlink(self):
+        realtime = bool(self.filtered("realtime_enrollment"))
+        result = super().unlink()
+        if realtime:
+            self._get_realtime_configuration_ids.clear_cache(self)
+        return result
 
     @api.depends("filter_id.domain", "filter_id", "editable_domain")
     def _compute_domain(self):
@@ -105,63 +186,12 @@ class AutomationConfiguration(models.Model):
             ) or record.editable_domain
 
     @api.depends()
-    def _compute_click_count(self):
-        data = self.env["link.tracker.click"].read_group(
-            [("automation_configuration_id", "in", self.ids)],
-            [],
-            ["automation_configuration_id"],
-            lazy=False,
-        )
-        mapped_data = {d["automation_configuration_id"][0]: d["__count"] for d in data}
-        for record in self:
-            record.click_count = mapped_data.get(record.id, 0)
-
-    @api.depends()
-    def _compute_activity_count(self):
-        data = self.env["automation.record.step"].read_group(
-            [
-                ("configuration_id", "in", self.ids),
-                ("state", "=", "done"),
-                ("is_test", "=", False),
-            ],
-            [],
-            ["configuration_id", "step_type"],
-            lazy=False,
-        )
-        mapped_data = defaultdict(lambda: {})
-        for d in data:
-            mapped_data[d["configuration_id"][0]][d["step_type"]] = d["__count"]
-        for record in self:
-            record.activity_mail_count = mapped_data[record.id].get("mail", 0)
-            record.activity_action_count = mapped_data[record.id].get("action", 0)
-
-    @api.depends()
-    def _compute_record_count(self):
-        data = self.env["automation.record"].read_group(
-            [("configuration_id", "in", self.ids), ("is_test", "=", False)],
-            [],
-            ["configuration_id", "state"],
-            lazy=False,
-        )
-        mapped_data = defaultdict(lambda: {})
-        for d in data:
-            mapped_data[d["configuration_id"][0]][d["state"]] = d["__count"]
-        for record in self:
-            record.record_done_count = mapped_data[record.id].get("done", 0)
-            record.record_run_count = mapped_data[record.id].get("periodic", 0)
-            record.record_count = sum(mapped_data[record.id].values())
-
-    @api.depends()
-    def _compute_record_test_count(self):
-        data = self.env["automation.record"].read_group(
-            [("configuration_id", "in", self.ids), ("is_test", "=", True)],
-            [],
-            ["configuration_id"],
-            lazy=False,
-        )
-        mapped_data = {d["configuration_id"][0]: d["__count"] for d in data}
+    def _compute_stats(self):
+        stats = self.env["automation.configuration.stat"]._get_stats(self.ids)
         for record in self:
-            record.record_test_count = mapped_data.get(record.id, 0)
+            stat = stats.get(record.id)
+            for field in STAT_FIELDS:
+                record[field] = stat[field] if stat else 0
 
     @api.depends("model_id")
     def _compute_filter_domain(self):
@@ -170,16 +200,6 @@ class AutomationConfiguration(models.Model):
                 [] if not record.model_id else [("model_id", "=", record.model_id.id)]
             )
 
-    @api.depends("state")
-    def _compute_next_execution_date(self):
-        for record in self:
-            if record.state == "periodic":
-                record.next_execution_date = self.env.ref(
-                    "automation_oca.cron_configuration_run"
-                ).nextcall
-            else:
-                record.next_execution_date = False
-
     @api.onchange("filter_id")
     def _onchange_filter(self):
         self.model_id = self.filter_id.model_id
@@ -196,18 +216,155 @@ class AutomationConfiguration(models.Model):
         if self.state != "draft":
             raise ValidationError(_("State must be in draft in order to start"))
         self.state = "periodic" if self.is_periodic else "ondemand"
+        # Records might have been modified meanwhile
+        self.last_full_scan_date = False
+        if self.state == "periodic":
+            self.next_execution_date = fields.Datetime.now()
+            self.env.ref("automation_oca.cron_configuration_run")._trigger(
+                self.next_execution_date
+            )
 
     def done_automation(self):
         self.ensure_one()
         self.state = "done"
+        self.next_execution_date = False
 
     def back_to_draft(self):
         self.ensure_one()
         self.state = "draft"
+        self.next_execution_date = False
+
+    def cron_automation(self, batch_size=None, time_budget=None):
+        """Enroll the records of the periodic configurations that are due.
+
+        The errors of a configuration don't affect the others. When several
+        workers are configured, configurations are run in parallel, each one
+        with its own cursor. The transaction is committed after each chunk of
+        records. When the time budget is exhausted, the cron is
+        triggered again in order to continue with the remaining records.
+        Otherwise, it is triggered for the next configuration to execute.
+        """
+        deadline = self._get_cron_deadline(time_budget)
+        configuration_ids = self.search(
+            [
+                ("state", "=", "periodic"),
+                "|",
+                ("next_execution_date", "=", False),
+                ("next_execution_date", "<=", fields.Datetime.now()),
+            ]
+        ).ids
+        self.env.flush_all()
+        workers = min(self._get_cron_workers(), len(configuration_ids))
+        testing = getattr(threading.current_thread(), "testing", False)
+        if workers > 1 and not testing:
+            dbname = self.env.cr.dbname
+
+            def run_unit(configuration_id):
+                # Worker threads don't inherit the attributes of the cron thread
+                threading.current_thread().dbname = dbname
+                threading.current_thread().testing = testing
+                return self._run_automation_unit(
+                    configuration_id, batch_size, deadline, new_cursor=True
+                )
+
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = list(executor.map(run_unit, configuration_ids))
+        else:
+            results = [
+                self._run_automation_unit(configuration_id, batch_size, deadline)
+                for configuration_id in configuration_ids
+            ]
+        self.env.invalidate_all()
+        if not all(results):
+            self._cron_continue("automation_oca.cron_configuration_run")
+            return
+        next_configuration = self.search(
+            [("state", "=", "periodic"), ("next_execution_date", "!=", False)],
+            order="next_execution_date",
+            limit=1,
+        )
+        if next_configuration:
+            self.env.ref("automation_oca.cron_configuration_run")._trigger(
+                next_configuration.next_execution_date
+            )
 
-    def cron_automation(self):
-        for record in self.search([("state", "=", "periodic")]):
-            record.run_automation()
+    @api.model
+    def _run_automation_unit(
+        self, configuration_id, batch_size=None, deadline=False, new_cursor=False
+    ):
+        """Run a periodic configuration, so it is not affected by the errors of
+        the others. Configurations run in parallel use their own cursor. It
+        returns False if the deadline is reached before finishing"""
+        if new_cursor:
+            with self.env.registry.cursor() as cr:
+                return self.with_env(self.env(cr=cr))._run_automation_unit(
+                    configuration_id, batch_size=batch_size, deadline=deadline
+                )
+        configuration = self.browse(configuration_id)
+        if not configuration._acquire_run_lock():
+            _logger.info(
+                "Automation configuration %s is already running", configuration_id
+            )
+            return True
+        # The transaction is committed after each chunk, except on tests,
+        # where the errors are isolated with a savepoint instead
+        auto_commit = not getattr(threading.current_thread(), "testing", False)
+        try:
+            if auto_commit:
+                done = configuration._run_automation(
+                    batch_size=batch_size, deadline=deadline, auto_commit=True
+                )
+            else:
+                with self.env.cr.savepoint():
+                    done = configuration._run_automation(
+                        batch_size=batch_size, deadline=deadline
+                    )
+            if not done:
+                return False
+        except Exception:
+            if auto_commit:
+                self.env.cr.rollback()
+            _logger.exception(
+                "Error while running automation configuration %s",
+                configuration_id,
+            )
+        finally:
+            configuration._release_run_lock()
+        configuration.next_execution_date = (
+            fields.Datetime.now() + configuration._get_execution_interval()
+        )
+        if auto_commit:
+            self._cron_commit()
+        return True
+
+    def _get_execution_interval(self):
+        return relativedelta(
+            **{self.execution_interval_type: max(self.execution_interval, 1)}
+        )
+
+    def _get_last_execution_dates(self):
+        """Return the date of the last run of the periodic configurations that
+        are waiting for their next execution"""
+        now = fields.Datetime.now()
+        return {
+            record.id: record.next_execution_date - record._get_execution_interval()
+            for record in self
+            if record.state == "periodic"
+            and record.next_execution_date
+            and record.next_execution_date > now
+        }
+
+    def _acquire_run_lock(self):
+        """Session level lock, as the transaction is committed after each chunk"""
+        self.env.cr.execute(
+            "SELECT pg_try_advisory_lock(%s, %s)", (RUN_LOCK_KEY, self.id)
+        )
+        return self.env.cr.fetchone()[0]
+
+    def _release_run_lock(self):
+        self.env.cr.execute(
+            "SELECT pg_advisory_unlock(%s, %s)", (RUN_LOCK_KEY, self.id)
+        )
 
     def _get_eval_context(self):
         """Prepare the context used when evaluating python code
@@ -221,19 +378,40 @@ class AutomationConfiguration(models.Model):
             "dateutil": safe_dateutil,
         }
 
-    def _get_automation_records_to_create(self):
+    @api.model
+    def _eval_domain(self, domain):
+        """Evaluate a domain string. Domains that don't use the evaluation
+        context are parsed once and cached, as they are evaluated by the crons
+        for every chunk and step"""
+        if DOMAIN_CONTEXT_NAMES_RE.search(domain):
+            return safe_eval(domain, self._get_eval_context())
+        return list(self._eval_static_domain(domain))
+
+    @tools.ormcache("domain")
+    def _eval_static_domain(self, domain):
+        return tuple(safe_eval(domain))
+
+    def _get_automation_records_to_create_query(
+        self, since=False, res_ids=None, extra_domain=None
+    ):
         """
         We will find all the records that fulfill the domain but don't have a record created.
         Also, we need to check by autencity field if defined.
 
         In order to do this, we will add some extra joins on the query of the domain
+
+        With ``since``, only the records modified after it are found, and with
+        ``res_ids``, only the given records.
         """
-        eval_context = self._get_eval_context()
-        domain = safe_eval(self.domain, eval_context)
+        domain = self._eval_domain(self.domain) + (extra_domain or [])
         Record = self.env[self.model_id.model]
         if self.company_id and "company_id" in Record._fields:
             # In case of company defined, we add only if the records have company field
             domain += [("company_id", "=", self.company_id.id)]
+        if since:
+            domain += [("write_date", ">=", since)]
+        if res_ids is not None:
+            domain += [("id", "in", list(res_ids))]
         query = Record._where_calc(domain)
         alias = query.left_join(
             query._tables[Record._table],
@@ -242,63 +420,250 @@ class AutomationConfiguration(models.Model):
             "res_id",
             "automation_record",
             "{rhs}.model = %s AND {rhs}.configuration_id = %s AND "
-            "({rhs}.is_test IS NULL OR NOT {rhs}.is_test)",
+            "{rhs}.is_test IS NOT TRUE",
             (Record._name, self.id),
         )
         query.add_where("{}.id is NULL".format(alias))
         if self.field_id:
-            # In case of unicity field defined, we need to add this
-            # left join to find already created records
-            linked_tab = query.left_join(
-                query._tables[Record._table],
-                self.field_id.name,
-                Record._table,
-                self.field_id.name,
-                "linked",
+            # In case of unicity field defined, records sharing its value with
+            # an enrolled record are skipped. Enrolled records store its hash.
+            # Records without a value have no hash, so they are never skipped
+            query.add_where(
+                """NOT EXISTS (
+                    SELECT 1
+                    FROM automation_record dedup
+                    WHERE dedup.configuration_id = %s
+                        AND dedup.dedup_key = md5("{}"."{}"::text)
+                        AND dedup.is_test IS NOT TRUE
+                )""".format(
+                    Record._table, self.field_id.name
+                ),
+                [self.id],
             )
-            alias2 = query.left_join(
-                linked_tab,
-                "id",
-                "automation_record",
-                "res_id",
-                "automation_record_linked",
-                "{rhs}.model = %s AND {rhs}.configuration_id = %s AND "
-                "({rhs}.is_test IS NULL OR NOT {rhs}.is_test)",
-                (Record._name, self.id),
-            )
-            query.add_where("{}.id is NULL".format(alias2))
-            from_clause, where_clause, params = query.get_sql()
-            # We also need to find with a group by in order to avoid duplication
-            # when we have both records created between two executions
-            # (first one has priority)
-            query_str = "SELECT {} FROM {} WHERE {}{}{}{} GROUP BY {}".format(
-                ", ".join([f'MIN("{next(iter(query._tables))}".id) as id']),
-                from_clause,
-                where_clause or "TRUE",
-                (" ORDER BY %s" % self.order) if query.order else "",
-                (" LIMIT %d" % self.limit) if query.limit else "",
-                (" OFFSET %d" % self.offset) if query.offset else "",
-                "%s.%s" % (query._tables[Record._table], self.field_id.name),
-            )
-        else:
-            query_str, params = query.select()
+        return query
+
+    def _get_automation_records_to_create(
+        self, after_id=0, limit=None, since=False, res_ids=None
+    ):
+        """Records are sorted by id, ``after_id`` and ``limit`` allow to read
+        them page by page"""
+        Record = self.env[self.model_id.model]
+        query = self._get_automation_records_to_create_query(
+            since=since, res_ids=res_ids
+        )
+        query.add_where(f'"{Record._table}".id > %s', [after_id])
+        query.order = f'"{Record._table}".id'
+        query.limit = limit
+        query_str, params = query.select()
         self.env.cr.execute(query_str, params)
         return Record.browse([r[0] for r in self.env.cr.fetchall()])
 
+    def _get_enrollment_estimate(self):
+        """Estimate the enrollment without doing it: number of records that
+        would be enrolled, cost of the query and, for each direct step, the
+        number of records matching its domain and its planned dates."""
+        self.ensure_one()
+        query_str, params = self._get_enrollment_count_query()
+        self.env.cr.execute("EXPLAIN (FORMAT JSON) " + query_str, params)
+        query_cost = self.env.cr.fetchone()[0][0]["Plan"]["Total Cost"]
+        self.env.cr.execute(query_str, params)
+        record_count = self.env.cr.fetchone()[0]
+        steps = []
+        for step in self.automation_direct_step_ids:
+            query_str, params = self._get_enrollment_count_query(
+                extra_domain=self._eval_domain(step.domain)
+            )
+            self.env.cr.execute(query_str, params)
+            steps.append(
+                {
+                    "configuration_step_id": step.id,
+                    "record_count": self.env.cr.fetchone()[0],
+                    "scheduled_date": step._get_record_activity_scheduled_date(),
+                    "expiry_date": step._get_expiry_date(),
+                }
+            )
+        return {"record_count": record_count, "query_cost": query_cost, "steps": steps}
+
+    def _get_enrollment_count_query(self, extra_domain=None):
+        Record = self.env[self.model_id.model]
+        query = self._get_automation_records_to_create_query(extra_domain=extra_domain)
+        if not self.field_id:
+            return query.select("COUNT(*)")
+        # Only one record is enrolled for each value of the unicity field
+        field = '"{}"."{}"'.format(Record._table, self.field_id.name)
+        return query.select(
+            "COUNT(DISTINCT md5({field}::text)) "
+            "+ COUNT(*) FILTER (WHERE {field} IS NULL)".format(field=field)
+        )
+
+    def _get_dedup_keys(self, records):
+        """Return the hash of the unicity field of the records, by id"""
+        if not self.field_id or not records:
+            return {}
+        records.flush_recordset([self.field_id.name])
+        self.env.cr.execute(
+            'SELECT id, md5("{}"::text) FROM "{}" WHERE id IN %s'.format(
+                self.field_id.name, records._table
+            ),
+            (tuple(records.ids),),
+        )
+        return dict(self.env.cr.fetchall())
+
+    def _refresh_dedup_keys(self, since=False, res_ids=None):
+        """The value of the unicity field might have changed since the
+        enrollment, so we update the hash stored on the enrolled records,
+        only those written ``since`` or the ones of ``res_ids`` if given"""
+        if not self.field_id:
+            return
+        Record = self.env[self.model_id.model]
+        Record.flush_model([self.field_id.name])
+        self.env["automation.record"].flush_model(["dedup_key"])
+        query = """
+            UPDATE automation_record
+            SET dedup_key = md5(target."{field}"::text)
+            FROM "{table}" target
+            WHERE automation_record.configuration_id = %s
+                AND automation_record.model = %s
+                AND automation_record.res_id = target.id
+                AND automation_record.is_test IS NOT TRUE
+                AND automation_record.dedup_key
+                    IS DISTINCT FROM md5(target."{field}"::text)
+        """.format(
+            field=self.field_id.name, table=Record._table
+        )
+        params = [self.id, Record._name]
+        if since:
+            query += " AND target.write_date >= %s"
+            params.append(since)
+        if res_ids is not None:
+            if not res_ids:
+                return
+            query += " AND target.id IN %s"
+            params.append(tuple(res_ids))
+        self.env.cr.execute(query, params)
+        self.env["automation.record"].invalidate_model(["dedup_key"])
+
+    def _iter_automation_records_to_create(self, batch_size, since=False):
+        """Yield the records to enroll in chunks of ``batch_size``.
+
+        Ids are read with keyset pagination, so only one chunk is kept in
+        memory, whatever the size of the table.
+        """
+        last_id = 0
+        while True:
+            records = self._get_automation_records_to_create(
+                after_id=last_id, limit=batch_size, since=since
+            )
+            if not records:
+                return
+            yield records
+            last_id = records.ids[-1]
+
     def run_automation(self):
+        self.ensure_one()
+        self._run_automation()
+
+    def _run_automation(self, batch_size=None, deadline=False, auto_commit=False):
+        """Enroll the records in chunks of ``batch_size``.
+        It returns False if the deadline is reached before finishing"""
         self.ensure_one()
         if self.state not in ["periodic", "ondemand"]:
-            return
-        records = self.env["automation.record"]
-        for record in self._get_automation_records_to_create():
-            records |= self._create_record(record)
-        records.automation_step_ids._trigger_activities()
+            return True
+        batch_size = batch_size or self._get_cron_batch_size()
+        # Records store the start of their transaction as write date, so the
+        # scan must be dated at the start of the transaction too
+        scan_date = self.env.cr.now()
+        since = self._get_incremental_scan_date(scan_date)
+        self._refresh_dedup_keys(since)
+        for chunk in self._iter_automation_records_to_create(batch_size, since=since):
+            records = self._create_records(chunk)
+            records.automation_step_ids._trigger_activities()
+            if auto_commit:
+                self._cron_commit()
+                # The commit doesn't clear the cache, that would grow with
+                # every enrolled chunk
+                self.env.invalidate_all()
+            if self._cron_deadline_reached(deadline):
+                return False
+        vals = {"last_scan_date": scan_date}
+        if not since:
+            vals.update(last_full_scan_date=scan_date, last_scan_domain=self.domain)
+        self.write(vals)
+        return True
+
+    @api.model
+    @tools.ormcache("model_name")
+    def _get_realtime_configuration_ids(self, model_name):
+        """Periodic configurations of the model with real time enrollment.
+        It is called on every create and write of mail threads, so it is cached.
+        Clearing it clears all the caches of the registry, so it is only done
+        when a real time configuration changes."""
+        return tuple(
+            self.sudo()
+            .search(
+                [
+                    ("model", "=", model_name),
+                    ("state", "=", "periodic"),
+                    ("realtime_enrollment", "=", True),
+                ]
+            )
+            .ids
+        )
+
+    def _run_realtime_automation(self, res_ids):
+        """Enroll the given records that match the configuration"""
+        for record in self.filtered(lambda r: r.state == "periodic"):
+            # The written records might share their new value with an
+            # enrolled record, or not anymore
+            record._refresh_dedup_keys(res_ids=res_ids)
+            records = record._create_records(
+                record._get_automation_records_to_create(res_ids=res_ids)
+            )
+            records.automation_step_ids._trigger_activities()
+
+    def _get_incremental_scan_date(self, scan_date):
+        """Return the date from which modified records must be checked,
+        or False if a full scan is needed"""
+        if (
+            not self.incremental_enrollment
+            or not self.last_full_scan_date
+            or not self.last_scan_date
+            or self.last_scan_domain != self.domain
+            or "write_date" not in self.env[self.model_id.model]._fields
+            or self.last_full_scan_date + timedelta(hours=self.full_scan_interval)
+            <= scan_date
+        ):
+            return False
+        return self.last_scan_date - SCAN_MARGIN
 
     def _create_record(self, record, **kwargs):
         return self.env["automation.record"].create(
             self._create_record_vals(record, **kwargs)
         )
 
+    def _create_records(self, records, **kwargs):
+        """Enroll several records, creating them and their steps in bulk.
+        Records enrolled meanwhile by another transaction are skipped"""
+        if kwargs.get("is_test"):
+            return self.env["automation.record"].create(
+                [self._create_record_vals(record, **kwargs) for record in records]
+            )
+        dedup_keys = self._get_dedup_keys(records)
+        seen_keys = set()
+        vals_list = []
+        for record in records:
+            dedup_key = dedup_keys.get(record.id)
+            if not dedup_key:
+                # Records without a value cannot be duplicates
+                vals_list.append(self._create_record_vals(record, **kwargs))
+            elif dedup_key not in seen_keys:
+                # Only the first record with the same value is enrolled
+                seen_keys.add(dedup_key)
+                vals_list.append(
+                    self._create_record_vals(record, dedup_key=dedup_key, **kwargs)
+                )
+        return self.env["automation.record"]._create_enrollments(vals_list)
+
     def _create_record_vals(self, record, **kwargs):
         return {
             **kwargs,
@@ -0,0 +1,188 @@
+# Copyright 2024 Dixmit
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+STAT_FIELDS = [
+    "record_count",
+    "record_run_count",
+    "record_done_count",
+    "record_test_count",
+    "activity_mail_count",
+    "activity_action_count",
+    "click_count",
+]
+
+
+class AutomationConfigurationStat(models.Model):
+    """Counters of the configurations. Changes are appended as new rows, so
+    concurrent transactions never update the same row, and merged by a cron.
+    The step daily statistics are stored the same way."""
+
+    _name = "automation.configuration.stat"
+    _description = "Automation configuration statistics"
+    _log_access = False
+
+    configuration_id = fields.Many2one(
+        "automation.configuration",
+        required=True,
+        readonly=True,
+        index=True,
+        ondelete="cascade",
+    )
+    record_count = fields.Integer(readonly=True)
+    record_run_count = fields.Integer(readonly=True)
+    record_done_count = fields.Integer(readonly=True)
+    record_test_count = fields.Integer(readonly=True)
+    activity_mail_count = fields.Integer(readonly=True)
+    activity_action_count = fields.Integer(readonly=True)
+    click_count = fields.Integer(readonly=True)
+
+    @api.model
+    def _get_stats(self, configuration_ids):
+        """Return the statistics of the configurations, by configuration id"""
+        for model in ["automation.record", "automation.record.step"]:
+            self.env[model].flush_model(["state"])
+        return {
+            stat["configuration_id"][0]: stat
+            for stat in self.read_group(
+                [("configuration_id", "in", configuration_ids)],
+                ["%s:sum" % field for field in STAT_FIELDS],
+                ["configuration_id"],
+            )
+        }
+
+    @api.model
+    def _increment(self, counters):
+        """Add the deltas of ``counters``: {configuration_id: {field: delta}}"""
+        for configuration_id, deltas in counters.items():
+            if not configuration_id or not any(deltas.values()):
+                continue
+            self.env.cr.execute(
+                """
+                INSERT INTO automation_configuration_stat (
+                    configuration_id, {columns}
+                )
+                SELECT %s, {placeholders}
+                WHERE EXISTS (
+                    SELECT 1 FROM automation_configuration_stat
+                    WHERE configuration_id = %s
+                )
+                """.format(
+                    columns=", ".join(STAT_FIELDS),
+                    placeholders=", ".join(["%s"] * len(STAT_FIELDS)),
+                ),
+                [configuration_id]
+                + [deltas.get(field, 0) for field in STAT_FIELDS]
+                + [configuration_id],
+            )
+        self.invalidate_model()
+
+    @api.model
+    def _reconcile(self, configuration_ids=None):
+        """Recount the statistics of the configurations, all by default"""
+        if configuration_ids is not None and not configuration_ids:
+            return
+        self.env.flush_all()
+        if configuration_ids:
+            self.env.cr.execute(
+                "DELETE FROM automation_configuration_stat "
+                "WHERE configuration_id IN %s",
+                (tuple(configuration_ids),),
+            )
+        else:
+            self.env.cr.execute("DELETE FROM automation_configuration_stat")
+        query = """
+            INSERT INTO automation_configuration_stat (
+                configuration_id, {columns}
+            )
+            SELECT
+                configuration.id,
+                (
+                    SELECT COUNT(*) FROM automation_record record
+                    WHERE record.configuration_id = configuration.id
+                        AND record.is_test IS NOT TRUE
+                ),
+                (
+                    SELECT COUNT(*) FROM automation_record record
+                    WHERE record.configuration_id = configuration.id
+                        AND record.is_test IS NOT TRUE
+                        AND record.state = 'run'
+                ),
+                (
+                    SELECT COUNT(*) FROM automation_record record
+                    WHERE record.configuration_id = configuration.id
+                        AND record.is_test IS NOT TRUE
+                        AND record.state = 'done'
+                ),
+                (
+                    SELECT COUNT(*) FROM automation_record record
+                    WHERE record.configuration_id = configuration.id
+                        AND record.is_test
+                ),
+                (
+                    SELECT COUNT(*) FROM automation_record_step step
+                    WHERE step.configuration_id = configuration.id
+                        AND step.is_test IS NOT TRUE
+                        AND step.state = 'done'
+                        AND step.step_type = 'mail'
+                ),
+                (
+                    SELECT COUNT(*) FROM automation_record_step step
+                    WHERE step.configuration_id = configuration.id
+                        AND step.is_test IS NOT TRUE
+                        AND step.state = 'done'
+                        AND step.step_type = 'action'
+                ),
+                (
+                    SELECT COUNT(*) FROM link_tracker_click click
+                    WHERE click.automation_configuration_id = configuration.id
+                )
+            FROM automation_configuration configuration
+            {where}
+        """.format(
+            columns=", ".join(STAT_FIELDS),
+            where="WHERE configuration.id IN %s" if configuration_ids else "",
+        )
+        self.env.cr.execute(
+            query, [tuple(configuration_ids)] if configuration_ids else []
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _compact(self):
+        """Merge the rows of each configuration into a single one"""
+        self.env.cr.execute(
+            """
+            WITH compacted AS (
+                DELETE FROM automation_configuration_stat
+                WHERE configuration_id IN (
+                    SELECT configuration_id
+                    FROM automation_configuration_stat
+                    GROUP BY configuration_id
+                    HAVING COUNT(*) > 1
+                )
+                RETURNING configuration_id, {columns}
+            )
+            INSERT INTO automation_configuration_stat (configuration_id, {columns})
+            SELECT configuration_id, {sums}
+            FROM compacted
+            GROUP BY configuration_id
+            """.format(
+                columns=", ".join(STAT_FIELDS),
+                sums=", ".join("SUM(%s)" % field for field in STAT_FIELDS),
+            )
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _cron_compact(self):
+        self._compact()
+        self.env["automation.step.stat.daily"]._refresh_tracking()
+        self.env["automation.step.stat.daily"]._compact()
+
+    @api.model
+    def _cron_reconcile(self):
+        self.env["automation.record"]._recompute_state(reconcile=False)
+        self._reconcile()
+        self.env["automation.step.stat.daily"]._reconcile()
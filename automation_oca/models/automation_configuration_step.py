@@ -10,7 +10,12 @@ from odoo import _, api, fields, models
 from odoo.exceptions import ValidationError
 from odoo.osv import expression
 from odoo.tools import get_lang
-from odoo.tools.safe_eval import safe_eval
+
+from .automation_step_stat_daily import (
+    DAILY_STATES,
+    DAILY_TRIGGER_FIELDS,
+    MAIL_COUNTERS,
+)
 
 
 class AutomationConfigurationStep(models.Model):
@@ -72,6 +77,17 @@ class AutomationConfigurationStep(models.Model):
     server_action_id = fields.Many2one(
         "ir.actions.server", domain="[('model_id', '=', model_id)]"
     )
+    server_action_batch = fields.Boolean(
+        string="Batch execution",
+        help="Execute the server action once for a group of records, "
+        "passing all of them on active_ids. Use it only with actions "
+        "that can process several records at once.",
+    )
+    server_action_batch_size = fields.Integer(
+        string="Batch size",
+        default=100,
+        help="Maximum number of records processed on each execution",
+    )
     activity_type_id = fields.Many2one(
         "mail.activity.type",
         string="Activity",
@@ -130,6 +146,15 @@ class AutomationConfigurationStep(models.Model):
     graph_data = fields.Json(compute="_compute_graph_data")
     graph_done = fields.Integer(compute="_compute_total_graph_data")
     graph_error = fields.Integer(compute="_compute_total_graph_data")
+    mail_sent_count = fields.Integer(compute="_compute_mail_stats")
+    mail_open_count = fields.Integer(compute="_compute_mail_stats")
+    mail_click_count = fields.Integer(compute="_compute_mail_stats")
+    mail_reply_count = fields.Integer(compute="_compute_mail_stats")
+    mail_bounce_count = fields.Integer(compute="_compute_mail_stats")
+    mail_open_rate = fields.Float(compute="_compute_mail_stats", digits=(16, 1))
+    mail_click_rate = fields.Float(compute="_compute_mail_stats", digits=(16, 1))
+    mail_reply_rate = fields.Float(compute="_compute_mail_stats", digits=(16, 1))
+    mail_bounce_rate = fields.Float(compute="_compute_mail_stats", digits=(16, 1))
 
     @api.onchange("trigger_type")
     def _onchange_trigger_type(self):
@@ -141,91 +166,93 @@ class AutomationConfigurationStep(models.Model):
     # Graph computed fields ################
     ########################################
 
-    @api.depends()
+    def _get_graph_days(self):
+        return self.env.context.get("automation_graph_days", 14)
+
+    @api.depends_context("automation_graph_days", "tz")
     def _compute_graph_data(self):
-        total = self.env["automation.record.step"].read_group(
-            [
-                ("configuration_step_id", "in", self.ids),
-                (
-                    "processed_on",
-                    ">=",
-                    fields.Date.context_today(self) + relativedelta(days=-14),
-                ),
-                ("is_test", "=", False),
-            ],
-            ["configuration_step_id"],
-            ["configuration_step_id", "processed_on:day"],
-            lazy=False,
-        )
-        done = self.env["automation.record.step"].read_group(
+        days = self._get_graph_days()
+        now = fields.Datetime.now()
+        self.env["automation.record.step"].flush_model(list(DAILY_TRIGGER_FIELDS))
+        # Statistics are stored by hour, they are grouped by day on the
+        # timezone of the user
+        stats = self.env["automation.step.stat.daily"].read_group(
             [
                 ("configuration_step_id", "in", self.ids),
-                (
-                    "processed_on",
-                    ">=",
-                    fields.Date.context_today(self) + relativedelta(days=-14),
-                ),
-                ("state", "=", "done"),
-                ("is_test", "=", False),
+                ("date", ">=", now + relativedelta(days=-days - 1)),
             ],
-            ["configuration_step_id"],
-            ["configuration_step_id", "processed_on:day"],
+            ["%s:sum" % state for state in DAILY_STATES],
+            ["configuration_step_id", "date:day"],
             lazy=False,
         )
-        now = fields.Datetime.now()
         date_map = {
             babel.dates.format_datetime(
-                now + relativedelta(days=i - 14),
+                now + relativedelta(days=i - days),
                 format="dd MMM yyy",
                 tzinfo=self._context.get("tz", None),
                 locale=get_lang(self.env).code,
             ): 0
-            for i in range(0, 15)
+            for i in range(0, days + 1)
         }
         result = defaultdict(
             lambda: {"done": date_map.copy(), "error": date_map.copy()}
         )
-        for line in total:
-            result[line["configuration_step_id"][0]]["error"][
-                line["processed_on:day"]
-            ] += line["__count"]
-        for line in done:
-            result[line["configuration_step_id"][0]]["done"][
-                line["processed_on:day"]
-            ] += line["__count"]
-            result[line["configuration_step_id"][0]]["error"][
-                line["processed_on:day"]
-            ] -= line["__count"]
+        for stat in stats:
+            day = stat["date:day"]
+            if day not in date_map:
+                continue
+            graph_info = result[stat["configuration_step_id"][0]]
+            graph_info["done"][day] += stat["done"] or 0
+            graph_info["error"][day] += sum(
+                stat[state] or 0 for state in DAILY_STATES if state != "done"
+            )
         for record in self:
-            graph_info = dict(result[record.id])
+            graph_info = result[record.id]
             record.graph_data = {
-                "error": [
-                    {"x": key[:-5], "y": value, "name": key}
-                    for (key, value) in graph_info["error"].items()
-                ],
-                "done": [
-                    {"x": key[:-5], "y": value, "name": key}
-                    for (key, value) in graph_info["done"].items()
-                ],
+                key: [
+                    {"x": day[:-5], "y": value, "name": day}
+                    for (day, value) in graph_info[key].items()
+                ]
+                for key in ["error", "done"]
             }
 
     @api.depends()
     def _compute_total_graph_data(self):
+        self.env["automation.record.step"].flush_model(list(DAILY_TRIGGER_FIELDS))
+        stats = {
+            stat["configuration_step_id"][0]: stat
+            for stat in self.env["automation.step.stat.daily"].read_group(
+                [("configuration_step_id", "in", self.ids)],
+                ["%s:sum" % state for state in DAILY_STATES],
+                ["configuration_step_id"],
+            )
+        }
         for record in self:
-            record.graph_done = self.env["automation.record.step"].search_count(
-                [
-                    ("configuration_step_id", "=", record.id),
-                    ("state", "=", "done"),
-                    ("is_test", "=", False),
-                ]
+            stat = stats.get(record.id, {})
+            record.graph_done = stat.get("done") or 0
+            record.graph_error = sum(
+                stat.get(state) or 0 for state in DAILY_STATES if state != "done"
             )
-            record.graph_error = self.env["automation.record.step"].search_count(
-                [
-                    ("configuration_step_id", "=", record.id),
-                    ("state", "in", ["expired", "rejected", "error", "cancel"]),
-                    ("is_test", "=", False),
-                ]
+
+    @api.depends()
+    def _compute_mail_stats(self):
+        self.env["automation.record.step"].flush_model(list(DAILY_TRIGGER_FIELDS))
+        stats = {
+            stat["configuration_step_id"][0]: stat
+            for stat in self.env["automation.step.stat.daily"].read_group(
+                [("configuration_step_id", "in", self.ids)],
+                ["%s:sum" % counter for counter in MAIL_COUNTERS],
+                ["configuration_step_id"],
             )
+        }
+        for record in self:
+            stat = stats.get(record.id, {})
+            sent = stat.get("mail_sent") or 0
+            for counter in MAIL_COUNTERS:
+                count = stat.get(counter) or 0
+                record["%s_count" % counter] = count
+                if counter != "mail_sent":
+                    record["%s_rate" % counter] = 100.0 * count / sent if sent else 0
 
     @api.depends("step_type")
     def _compute_activity_info(self):
@@ -264,15 +291,14 @@ class AutomationConfigurationStep(models.Model):
         "domain", "configuration_id.domain", "parent_id", "parent_id.applied_domain"
     )
     def _compute_applied_domain(self):
+        Configuration = self.env["automation.configuration"]
         for record in self:
-            eval_context = record.configuration_id._get_eval_context()
             record.applied_domain = expression.AND(
                 [
-                    safe_eval(record.domain, eval_context),
-                    safe_eval(
+                    Configuration._eval_domain(record.domain),
+                    Configuration._eval_domain(
                         (record.parent_id and record.parent_id.applied_domain)
-                        or record.configuration_id.domain,
-                        eval_context,
+                        or record.configuration_id.domain
                     ),
                 ]
             )
@@ -504,6 +530,7 @@ class AutomationConfigurationStep(models.Model):
     def _create_record_activity_vals(self, record, **kwargs):
         return {
             "configuration_step_id": self.id,
+            "parent_position": self.parent_position,
             "expiry_date": self._get_expiry_date(),
             "scheduled_date": self._get_record_activity_scheduled_date(),
             **kwargs,
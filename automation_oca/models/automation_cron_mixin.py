@@ -0,0 +1,72 @@
+# Copyright 2024 Dixmit
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+import threading
+import time
+
+from odoo import api, models
+from odoo.tools import config
+
+
+class AutomationCronMixin(models.AbstractModel):
+
+    _name = "automation.cron.mixin"
+    _description = "Automation cron helpers"
+
+    @api.model
+    def _get_cron_batch_size(self):
+        """Number of items processed between two commits"""
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("automation_oca.cron_batch_size", 1000)
+        )
+
+    @api.model
+    def _get_cron_workers(self):
+        """Number of threads running independent units of work in parallel"""
+        return int(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("automation_oca.cron_workers", 1)
+        )
+
+    @api.model
+    def _get_cron_time_budget(self):
+        """
+        Seconds that a cron execution can spend before leaving the remaining
+        work to a new execution. By default, we use half of the real time limit
+        of the cron workers. Zero means no limit.
+        """
+        budget = (
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("automation_oca.cron_time_budget")
+        )
+        if budget:
+            return float(budget)
+        limit = config.get("limit_time_real_cron", -1)
+        if limit is None or limit < 0:
+            limit = config.get("limit_time_real", 0)
+        return limit / 2 if limit and limit > 0 else 0
+
+    @api.model
+    def _get_cron_deadline(self, time_budget=None):
+        if time_budget is None:
+            time_budget = self._get_cron_time_budget()
+        return time.monotonic() + time_budget if time_budget else False
+
+    @api.model
+    def _cron_deadline_reached(self, deadline):
+        return bool(deadline) and time.monotonic() >= deadline
+
+    @api.model
+    def _cron_commit(self):
+        # auto-commit except in testing mode
+        if not getattr(threading.current_thread(), "testing", False):
+            self.env.cr.commit()  # pylint: disable=invalid-commit
+
+    @api.model
+    def _cron_continue(self, cron_xmlid):
+        """Wake up the cron in order to continue with the remaining work"""
+        self.env.ref(cron_xmlid)._trigger()
@@ -5,6 +5,7 @@ import logging
 from collections import defaultdict
 
 from odoo import api, fields, models
+from odoo.tools.sql import create_index, index_exists
 
 _logger = logging.getLogger(__name__)
 
@@ -15,9 +16,12 @@ class AutomationRecord(models.Model):
     _description = "Automation Record"
 
     name = fields.Char(compute="_compute_name")
+    # The state is derived from the scheduled steps, see
+    # _update_scheduled_step_count
     state = fields.Selection(
-        [("run", "Running"), ("done", "Done")], compute="_compute_state", store=True
+        [("run", "Running"), ("done", "Done")], default="done", readonly=True
     )
+    scheduled_step_count = fields.Integer(default=0, readonly=True, copy=False)
     configuration_id = fields.Many2one(
         "automation.configuration", required=True, readonly=True
     )
@@ -39,6 +43,256 @@ class AutomationRecord(models.Model):
         "automation.record.step", inverse_name="record_id", readonly=True
     )
     is_test = fields.Boolean()
+    # Hash of the value of the unicity field of the configuration
+    dedup_key = fields.Char(readonly=True, copy=False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        counters = defaultdict(lambda: defaultdict(int))
+        for record in records:
+            if record.is_test:
+                counters[record.configuration_id.id]["record_test_count"] += 1
+                continue
+            # Records are created done, their scheduled steps set them running
+            counters[record.configuration_id.id]["record_count"] += 1
+            counters[record.configuration_id.id]["record_done_count"] += 1
+        self.env["automation.configuration.stat"]._increment(counters)
+        return records
+
+    def _write(self, vals):
+        if "state" not in vals or not self:
+            return super()._write(vals)
+        self.env.cr.execute(
+            """
+            SELECT configuration_id, state, COUNT(*)
+            FROM automation_record
+            WHERE id IN %s AND is_test IS NOT TRUE AND state IS DISTINCT FROM %s
+            GROUP BY configuration_id, state
+            """,
+            (tuple(self.ids), vals["state"]),
+        )
+        rows = self.env.cr.fetchall()
+        result = super()._write(vals)
+        counters = defaultdict(lambda: defaultdict(int))
+        for configuration_id, state, count in rows:
+            if state:
+                counters[configuration_id]["record_%s_count" % state] -= count
+            if vals["state"]:
+                counters[configuration_id]["record_%s_count" % vals["state"]] += count
+        self.env["automation.configuration.stat"]._increment(counters)
+        return result
+
+    def unlink(self):
+        configurations = self.configuration_id
+        result = super().unlink()
+        # Steps are removed by the database, so we recount everything
+        self.env["automation.configuration.stat"]._reconcile(configurations.ids)
+        return result
+
+    @api.model
+    def _update_scheduled_step_count(self, deltas):
+        """Add ``deltas``: {record_id: delta} to the scheduled steps of the
+        records, and update their state and the statistics accordingly"""
+        deltas = {record_id: delta for record_id, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.flush_model(["scheduled_step_count", "state"])
+        self.env.cr.execute(
+            """
+            UPDATE automation_record record
+            SET scheduled_step_count = (
+                    COALESCE(record.scheduled_step_count, 0) + delta.value
+                ),
+                state = CASE
+                    WHEN COALESCE(record.scheduled_step_count, 0) + delta.value > 0
+                        THEN 'run'
+                    ELSE 'done'
+                END
+            FROM unnest(%s, %s) AS delta(record_id, value),
+                automation_record old
+            WHERE record.id = delta.record_id AND old.id = record.id
+            RETURNING record.configuration_id, record.is_test, old.state, record.state
+            """,
+            (list(deltas), list(deltas.values())),
+        )
+        counters = defaultdict(lambda: defaultdict(int))
+        for configuration_id, is_test, old_state, state in self.env.cr.fetchall():
+            if is_test or old_state == state:
+                continue
+            if old_state:
+                counters[configuration_id]["record_%s_count" % old_state] -= 1
+            counters[configuration_id]["record_%s_count" % state] += 1
+        self.browse(deltas).invalidate_recordset(["scheduled_step_count", "state"])
+        self.env["automation.configuration.stat"]._increment(counters)
+
+    @api.model
+    def _recompute_state(self, record_ids=None, reconcile=True):
+        """Recount the scheduled steps and the state of the records, all by
+        default. It should only be needed to repair the records."""
+        self.env.flush_all()
+        where = "WHERE record.id IN %s" if record_ids else ""
+        self.env.cr.execute(
+            """
+            UPDATE automation_record record
+            SET scheduled_step_count = counted.value,
+                state = CASE WHEN counted.value > 0 THEN 'run' ELSE 'done' END
+            FROM (
+                SELECT record.id, COUNT(step.id) AS value
+                FROM automation_record record
+                LEFT JOIN automation_record_step step
+                    ON step.record_id = record.id AND step.state = 'scheduled'
+                {where}
+                GROUP BY record.id
+            ) AS counted
+            WHERE counted.id = record.id
+                AND (
+                    record.scheduled_step_count IS DISTINCT FROM counted.value
+                    OR record.state IS DISTINCT FROM
+                        CASE WHEN counted.value > 0 THEN 'run' ELSE 'done' END
+                )
+            RETURNING record.configuration_id
+            """.format(
+                where=where
+            ),
+            [tuple(record_ids)] if record_ids else [],
+        )
+        rows = self.env.cr.fetchall()
+        if rows:
+            _logger.info("Recomputed the state of %s automation records", len(rows))
+        configuration_ids = {row[0] for row in rows}
+        self.invalidate_model(["scheduled_step_count", "state"])
+        if reconcile and configuration_ids:
+            self.env["automation.configuration.stat"]._reconcile(
+                list(configuration_ids)
+            )
+        return configuration_ids
+
+    def init(self):
+        # Count the scheduled steps of the records created before the counter
+        self.env.cr.execute(
+            """
+            SELECT 1 FROM automation_record
+            WHERE scheduled_step_count IS NULL
+                OR (state = 'run' AND scheduled_step_count = 0)
+            LIMIT 1
+            """
+        )
+        if self.env.cr.fetchone():
+            # The statistics tables might not be ready yet
+            self._recompute_state(reconcile=False)
+        create_index(
+            self.env.cr,
+            "automation_record_dedup_key_index",
+            self._table,
+            ["configuration_id", "dedup_key"],
+            where="dedup_key IS NOT NULL AND is_test IS NOT TRUE",
+        )
+        # A record can only be enrolled once on each configuration
+        if index_exists(self.env.cr, "automation_record_enrollment_unique"):
+            return
+        self.env.cr.execute(
+            """
+            SELECT 1
+            FROM automation_record
+            WHERE is_test IS NOT TRUE
+            GROUP BY configuration_id, model, res_id
+            HAVING COUNT(*) > 1
+            LIMIT 1
+            """
+        )
+        if self.env.cr.fetchone():
+            _logger.warning(
+                "Some records are enrolled twice on the same configuration, "
+                "the unique index on automation_record cannot be created"
+            )
+            return
+        self.env.cr.execute(
+            """
+            CREATE UNIQUE INDEX automation_record_enrollment_unique
+            ON automation_record (configuration_id, model, res_id)
+            WHERE is_test IS NOT TRUE
+            """
+        )
+
+    @api.model
+    def _create_enrollments(self, vals_list):
+        """Create the records and their steps, like create, but skipping the
+        ones already enrolled on their configuration, even by a concurrent
+        transaction.
+
+        Only the configuration, model, res_id and dedup_key are inserted with
+        SQL, other values are written afterwards.
+        """
+        if not vals_list:
+            return self.browse()
+        if not index_exists(self.env.cr, "automation_record_enrollment_unique"):
+            return self.create(vals_list)
+        self.flush_model()
+        now = fields.Datetime.now()
+        self.env.cr.execute(
+            """
+            INSERT INTO automation_record (
+                configuration_id, model, res_id, dedup_key, is_test, state,
+                scheduled_step_count, create_uid, create_date, write_uid, write_date
+            )
+            SELECT configuration_id, model, res_id, dedup_key, false, 'done', 0,
+                %(uid)s, %(now)s, %(uid)s, %(now)s
+            FROM unnest(
+                %(configuration_ids)s,
+                %(models)s,
+                %(res_ids)s,
+                %(dedup_keys)s::varchar[]
+            ) AS vals(configuration_id, model, res_id, dedup_key)
+            ON CONFLICT (configuration_id, model, res_id)
+                WHERE is_test IS NOT TRUE DO NOTHING
+            RETURNING configuration_id, res_id, id
+            """,
+            {
+                "uid": self.env.uid,
+                "now": now,
+                "configuration_ids": [vals["configuration_id"] for vals in vals_list],
+                "models": [vals["model"] for vals in vals_list],
+                "res_ids": [vals["res_id"] for vals in vals_list],
+                "dedup_keys": [vals.get("dedup_key") for vals in vals_list],
+            },
+        )
+        record_ids = {(row[0], row[1]): row[2] for row in self.env.cr.fetchall()}
+        step_vals_list = []
+        for vals in vals_list:
+            record_id = record_ids.get((vals["configuration_id"], vals["res_id"]))
+            if not record_id:
+                continue
+            step_vals_list += [
+                dict(command[2], record_id=record_id)
+                for command in vals.get("automation_step_ids", [])
+            ]
+            extra_vals = {
+                key: value
+                for key, value in vals.items()
+                if key
+                not in [
+                    "configuration_id",
+                    "model",
+                    "res_id",
+                    "dedup_key",
+                    "automation_step_ids",
+                ]
+            }
+            if extra_vals:
+                self.browse(record_id).write(extra_vals)
+        configuration_counts = defaultdict(int)
+        for configuration_id, _res_id in record_ids:
+            configuration_counts[configuration_id] += 1
+        self.env["automation.configuration.stat"]._increment(
+            {
+                configuration_id: {"record_count": count, "record_done_count": count}
+                for configuration_id, count in configuration_counts.items()
+            }
+        )
+        # The state is updated when the steps are created
+        self.env["automation.record.step"].create(step_vals_list)
+        return self.browse(sorted(record_ids.values()))
 
     @api.model
     def _selection_target_model(self):
@@ -49,15 +303,6 @@ class AutomationRecord(models.Model):
             .search([("is_mail_thread", "=", True)])
         ]
 
-    @api.depends("automation_step_ids.state")
-    def _compute_state(self):
-        for record in self:
-            record.state = (
-                "run"
-                if record.automation_step_ids.filtered(lambda r: r.state == "scheduled")
-                else "done"
-            )
-
     @api.depends("model", "res_id")
     def _compute_resource_ref(self):
         for record in self:
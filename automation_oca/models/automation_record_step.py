@@ -1,18 +1,27 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+import logging
 import threading
 import traceback
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
 from io import StringIO
 
 import werkzeug.urls
 from dateutil.relativedelta import relativedelta
 
 from odoo import _, api, fields, models, tools
-from odoo.tools.safe_eval import safe_eval
+from odoo.tools.sql import create_index
+
+from .automation_step_stat_daily import DAILY_TRIGGER_FIELDS
+
+_logger = logging.getLogger(__name__)
 
 
 class AutomationRecordStep(models.Model):
     _name = "automation.record.step"
+    _inherit = ["automation.cron.mixin"]
     _description = "Activities done on the record"
     _order = "scheduled_date ASC"
 
@@ -48,12 +57,12 @@ class AutomationRecordStep(models.Model):
         readonly=True,
     )
     error_trace = fields.Text(readonly=True)
-    parent_position = fields.Integer(
-        compute="_compute_parent_position", recursive=True, store=True
-    )
+    claimed_at = fields.Datetime(readonly=True, copy=False)
+    # Copied from the configuration step, see _create_record_activity_vals
+    parent_position = fields.Integer(readonly=True)
 
     # Mailing fields
-    message_id = fields.Char(readonly=True)
+    message_id = fields.Char(readonly=True, index="btree_not_null")
     mail_status = fields.Selection(
         [
             ("sent", "Sent"),
@@ -70,19 +79,37 @@ class AutomationRecordStep(models.Model):
     is_test = fields.Boolean(related="record_id.is_test", store=True)
     step_actions = fields.Json(compute="_compute_step_actions")
 
+    def init(self):
+        # The table is never purged, but the crons only look for scheduled steps
+        create_index(
+            self.env.cr,
+            "automation_record_step_scheduled_index",
+            self._table,
+            ["scheduled_date", "id"],
+            where="state = 'scheduled'",
+        )
+        create_index(
+            self.env.cr,
+            "automation_record_step_expiry_index",
+            self._table,
+            ["expiry_date", "id"],
+            where="state = 'scheduled' AND expiry_date IS NOT NULL",
+        )
+        # Used to refresh the mail funnel of the tracked mails
+        create_index(
+            self.env.cr,
+            "automation_record_step_mail_write_date_index",
+            self._table,
+            ["write_date"],
+            where="mail_status IS NOT NULL",
+        )
+
     @api.depends("trigger_type")
     def _compute_trigger_type_data(self):
         trigger_types = self.env["automation.configuration.step"]._trigger_types()
         for record in self:
             record.trigger_type_data = trigger_types[record.trigger_type]
 
-    @api.depends("parent_id", "parent_id.parent_position")
-    def _compute_parent_position(self):
-        for record in self:
-            record.parent_position = (
-                (record.parent_id.parent_position + 1) if record.parent_id else 0
-            )
-
     @api.depends("step_type")
     def _compute_step_info(self):
         step_icons = self.env["automation.configuration.step"]._step_icons()
@@ -93,6 +120,81 @@ class AutomationRecordStep(models.Model):
             record.step_icon = step_icons.get(record.step_type, "")
             record.step_name = step_name_map.get(record.step_type, "")
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        steps = super().create(vals_list)
+        deltas = defaultdict(int)
+        for step in steps.filtered(lambda r: r.state == "scheduled"):
+            deltas[step.record_id.id] += 1
+        self.env["automation.record"]._update_scheduled_step_count(deltas)
+        return steps
+
+    def write(self, vals):
+        result = super().write(vals)
+        fnames = DAILY_TRIGGER_FIELDS.intersection(vals)
+        if fnames:
+            # The records and the statistics are updated when the steps are
+            # flushed, so they are consistent within the transaction
+            self.flush_recordset(list(fnames))
+        return result
+
+    def _write(self, vals):
+        if not self or not DAILY_TRIGGER_FIELDS.intersection(vals):
+            return super()._write(vals)
+        counters = defaultdict(lambda: defaultdict(int))
+        deltas = defaultdict(int)
+        if "state" in vals:
+            self.env.cr.execute(
+                """
+                SELECT record_id, COUNT(*)
+                FROM automation_record_step
+                WHERE id IN %s AND (state = 'scheduled') != %s
+                GROUP BY record_id
+                """,
+                (tuple(self.ids), vals["state"] == "scheduled"),
+            )
+            delta = 1 if vals["state"] == "scheduled" else -1
+            for record_id, count in self.env.cr.fetchall():
+                deltas[record_id] += delta * count
+            # Only the done mails and actions are counted
+            self.env.cr.execute(
+                """
+                SELECT configuration_id, step_type, COUNT(*)
+                FROM automation_record_step
+                WHERE id IN %s
+                    AND is_test IS NOT TRUE
+                    AND step_type IN ('mail', 'action')
+                    AND (state = 'done') != %s
+                GROUP BY configuration_id, step_type
+                """,
+                (tuple(self.ids), vals["state"] == "done"),
+            )
+            delta = 1 if vals["state"] == "done" else -1
+            for configuration_id, step_type, count in self.env.cr.fetchall():
+                counters[configuration_id]["activity_%s_count" % step_type] += (
+                    delta * count
+                )
+        # The daily statistics are updated with the difference of the counters
+        daily = self.env["automation.step.stat.daily"]
+        before = daily._count_steps(self.ids)
+        result = super()._write(vals)
+        self.env["automation.record"]._update_scheduled_step_count(deltas)
+        self.env["automation.configuration.stat"]._increment(counters)
+        daily._increment(before, daily._count_steps(self.ids))
+        return result
+
+    def unlink(self):
+        configurations = self.configuration_id
+        configuration_steps = self.configuration_step_id
+        deltas = defaultdict(int)
+        for step in self.filtered(lambda r: r.state == "scheduled"):
+            deltas[step.record_id.id] -= 1
+        result = super().unlink()
+        self.env["automation.record"]._update_scheduled_step_count(deltas)
+        self.env["automation.configuration.stat"]._reconcile(configurations.ids)
+        self.env["automation.step.stat.daily"]._reconcile(configuration_steps.ids)
+        return result
+
     def _check_to_execute(self):
         if (
             self.configuration_step_id.trigger_type == "mail_not_open"
@@ -118,48 +220,149 @@ class AutomationRecordStep(models.Model):
 
     def run(self, trigger_activity=True):
         self.ensure_one()
-        if self.state != "scheduled":
-            return self.browse()
-        if (
-            self.record_id.resource_ref is None
-            or not self.record_id.resource_ref.filtered_domain(
-                safe_eval(self.configuration_step_id.applied_domain)
-            )
-            or not self._check_to_execute()
+        return self._run_batch(trigger_activity=trigger_activity)
+
+    def _run_batch(self, trigger_activity=True):
+        """Execute the scheduled steps of the recordset.
+
+        Steps are grouped by configuration step and every group is executed
+        at once. States are written with a single write per outcome and the
+        childs of all the executed steps are created with a single create.
+        """
+        steps = self.filtered(lambda r: r.state == "scheduled")
+        to_reject = self.browse()
+        to_fill = self.browse()
+        done = self.browse()
+        for _configuration_step, group in tools.groupby(
+            steps, key=lambda r: r.configuration_step_id
         ):
-            self.write({"state": "rejected", "processed_on": fields.Datetime.now()})
-            return self.browse()
+            group = self.browse().union(*group)
+            try:
+                with self._step_savepoint():
+                    to_execute = group._get_steps_to_execute()
+            except Exception:
+                # The domain of the configuration step cannot be evaluated
+                group._set_error()
+                continue
+            to_reject |= group - to_execute
+            if not to_execute:
+                continue
+            to_fill |= to_execute._run_step_batch()
+            done |= to_execute.filtered(lambda r: r.state == "scheduled")
+        now = fields.Datetime.now()
+        to_reject.write({"state": "rejected", "processed_on": now})
+        done.write({"state": "done", "processed_on": now})
+        childs = (to_fill & done)._fill_childs()
+        if trigger_activity:
+            childs._trigger_activities()
+        return childs
+
+    def _get_steps_to_execute(self):
+        """Return the steps of the recordset that must be executed.
+
+        All the steps must share the same configuration step, so the applied
+        domain is only evaluated once for each target model with a single
+        search.
+        """
+        domain = self.env["automation.configuration"]._eval_domain(
+            self.configuration_step_id.applied_domain
+        )
+        result = self.browse()
+        for model, steps in tools.groupby(self, key=lambda r: r.record_id.model):
+            steps = self.browse().union(*steps)
+            if not model or model not in self.env:
+                continue
+            # The domain is evaluated by the database, like filtered_domain,
+            # it must not be restricted by archived records or record rules
+            res_ids = set(
+                self.env[model]
+                .sudo()
+                .with_context(active_test=False)
+                .search([("id", "in", steps.mapped("record_id.res_id"))] + domain)
+                .ids
+            )
+            result |= steps.filtered(
+                lambda r: r.record_id.res_id in res_ids and r._check_to_execute()
+            )
+        return result
+
+    def _run_step_batch(self):
+        """Execute the steps of the recordset, all of them sharing the same
+        configuration step.
+
+        If the step type defines a ``_run_<step_type>_batch`` method, it
+        receives the whole recordset. Otherwise, ``_run_<step_type>`` is called
+        for each step. Steps that fail are set on error. It returns the steps
+        whose childs must be created.
+        """
+        step_type = self.configuration_step_id.step_type
+        batch_method = getattr(self, "_run_%s_batch" % step_type, None)
+        if batch_method is not None:
+            try:
+                with self._step_savepoint():
+                    return batch_method()
+            except Exception:
+                self._set_error()
+                return self.browse()
+        return self._run_step_per_record()
+
+    def _run_step_per_record(self):
+        """Execute ``_run_<step_type>`` for each step of the recordset"""
+        step_type = self.configuration_step_id.step_type
+        result_ids = []
+        for step in self:
+            try:
+                with self._step_savepoint():
+                    if getattr(step, "_run_%s" % step_type)():
+                        result_ids.append(step.id)
+            except Exception:
+                step._set_error()
+        return self.browse(result_ids)
+
+    def _is_step_method_overridden(self, step_type):
+        """Check if ``_run_<step_type>`` is overridden by another module, so
+        the batch execution must not bypass it"""
+        method = "_run_%s" % step_type
+        return getattr(type(self), method) is not getattr(AutomationRecordStep, method)
+
+    @contextmanager
+    def _step_savepoint(self):
+        """Isolate the execution of steps, so a failure doesn't abort the
+        transaction. Rollbacks are counted in order to log them on the cron."""
         try:
-            result = getattr(self, "_run_%s" % self.configuration_step_id.step_type)()
-            self.write({"state": "done", "processed_on": fields.Datetime.now()})
-            if result:
-                childs = self._fill_childs()
-                if trigger_activity:
-                    childs._trigger_activities()
-                return childs
+            with self.env.cr.savepoint():
+                yield
         except Exception:
-            buff = StringIO()
-            traceback.print_exc(file=buff)
-            traceback_txt = buff.getvalue()
-            self.write(
-                {
-                    "state": "error",
-                    "error_trace": traceback_txt,
-                    "processed_on": fields.Datetime.now(),
-                }
+            thread = threading.current_thread()
+            thread.automation_rollback_count = (
+                getattr(thread, "automation_rollback_count", 0) + 1
             )
-        return self.browse()
+            raise
+
+    def _set_error(self):
+        """Store the current exception on the steps.
+        It must be called while handling the exception, after the rollback"""
+        buff = StringIO()
+        traceback.print_exc(file=buff)
+        self.write(
+            {
+                "state": "error",
+                "error_trace": buff.getvalue(),
+                "processed_on": fields.Datetime.now(),
+            }
+        )
 
     def _fill_childs(self, **kwargs):
         return self.create(
             [
                 activity._create_record_activity_vals(
-                    self.record_id.resource_ref,
-                    parent_id=self.id,
-                    record_id=self.record_id.id,
+                    step.record_id.resource_ref,
+                    parent_id=step.id,
+                    record_id=step.record_id.id,
                     **kwargs
                 )
-                for activity in self.configuration_step_id.child_ids
+                for step in self
+                for activity in step.configuration_step_id.child_ids
             ]
         )
 
@@ -187,17 +390,132 @@ class AutomationRecordStep(models.Model):
         record.activity_schedule(**vals)
         return True
 
+    def _run_activity_batch(self):
+        """Create the activities of the steps with a single create for each
+        model.
+
+        If a model fails, or ``_run_activity`` is overridden, the steps are
+        executed one by one with ``_run_activity``.
+        """
+        if self.env.context.get("mail_activity_automation_skip"):
+            return self
+        if self._is_step_method_overridden("activity"):
+            return self._run_step_per_record()
+        result_ids = []
+        for _model, steps in tools.groupby(self, key=lambda r: r.record_id.model):
+            steps = self.browse().union(*steps)
+            try:
+                with self._step_savepoint():
+                    steps._run_activity_chunk()
+                result_ids += steps.ids
+            except Exception:
+                result_ids += steps._run_step_per_record().ids
+        return self.browse(result_ids)
+
+    def _run_activity_chunk(self):
+        """Create the activities of steps sharing the same model.
+
+        It follows the logic of ``activity_schedule``, but the users of the
+        records are read at once.
+        """
+        configuration_step = self.configuration_step_id
+        activity_type = configuration_step.activity_type_id
+        model = self[:1].record_id.model
+        date_deadline = fields.Date.context_today(self)
+        if configuration_step.activity_date_deadline_range > 0:
+            date_deadline += relativedelta(
+                **{
+                    configuration_step.activity_date_deadline_range_type: (
+                        configuration_step.activity_date_deadline_range
+                    )
+                }
+            )
+        user_id = activity_type.default_user_id.id or self.env.uid
+        if configuration_step.activity_user_type == "specific":
+            user_id = configuration_step.activity_user_id.id or user_id
+        record_users = {}
+        if configuration_step.activity_user_type == "generic":
+            field_name = configuration_step.activity_user_field_id.name
+            record_users = {
+                data["id"]: data[field_name]
+                for data in self.env[model]
+                .browse(self.mapped("record_id.res_id"))
+                .read([field_name], load=None)
+            }
+        model_id = self.env["ir.model"]._get_id(model)
+        self.env["mail.activity"].create(
+            [
+                {
+                    "activity_type_id": activity_type.id,
+                    "summary": configuration_step.activity_summary
+                    or activity_type.summary,
+                    "note": configuration_step.activity_note
+                    or activity_type.default_note,
+                    "automated": True,
+                    "date_deadline": date_deadline,
+                    "res_model_id": model_id,
+                    "res_id": step.record_id.res_id,
+                    "user_id": record_users.get(step.record_id.res_id) or user_id,
+                    "automation_record_step_id": step.id,
+                }
+                for step in self
+            ]
+        )
+
     def _run_mail(self):
-        author_id = self.configuration_step_id.mail_author_id.id
+        self._run_mail_composer()
+        self.mail_status = "sent"
+        return True
+
+    def _run_mail_batch(self):
+        """Queue the mails of all the steps using mass mail composers.
+
+        A composer can only generate one mail per record, so we need a new
+        composer each time a record is repeated. If a composer fails, its
+        steps are set on error. If ``_run_mail`` is overridden, the steps are
+        executed one by one with it.
+        """
+        if self._is_step_method_overridden("mail"):
+            return self._run_step_per_record()
+        result_ids = []
+        for steps in self._get_mail_batches():
+            try:
+                with self._step_savepoint():
+                    steps._run_mail_composer()
+                    steps.write({"mail_status": "sent"})
+                result_ids += steps.ids
+            except Exception:
+                steps._set_error()
+        return self.browse(result_ids)
+
+    def _get_mail_batches(self):
+        batches = defaultdict(list)
+        for step in self:
+            key = (step.is_test, step.record_id.model)
+            for batch in batches[key]:
+                if step.record_id.res_id not in batch:
+                    batch[step.record_id.res_id] = step.id
+                    break
+            else:
+                batches[key].append({step.record_id.res_id: step.id})
+        return [
+            self.browse(list(batch.values()))
+            for key_batches in batches.values()
+            for batch in key_batches
+        ]
+
+    def _run_mail_composer(self):
+        configuration_step = self.configuration_step_id
+        model = self[:1].record_id.model
+        res_ids = self.mapped("record_id.res_id")
         composer_values = {
-            "author_id": author_id,
+            "author_id": configuration_step.mail_author_id.id,
             "record_name": False,
-            "model": self.record_id.model,
+            "model": model,
             "composition_mode": "mass_mail",
-            "template_id": self.configuration_step_id.mail_template_id.id,
-            "automation_record_step_id": self.id,
+            "template_id": configuration_step.mail_template_id.id,
+            "automation_record_step_ids": [(6, 0, self.ids)],
         }
-        res_ids = [self.record_id.res_id]
         composer = (
             self.env["mail.compose.message"]
             .with_context(active_ids=res_ids)
@@ -205,22 +523,24 @@ class AutomationRecordStep(models.Model):
         )
         composer.write(
             composer._onchange_template_id(
-                self.configuration_step_id.mail_template_id.id,
+                configuration_step.mail_template_id.id,
                 "mass_mail",
-                self.record_id.model,
-                self.record_id.res_id,
+                model,
+                res_ids[0],
             )["value"]
         )
-        # composer.body =
         extra_context = self._run_mail_context()
         composer = composer.with_context(active_ids=res_ids, **extra_context)
-        # auto-commit except in testing mode
-        auto_commit = not getattr(threading.current_thread(), "testing", False)
-        if not self.is_test:
-            # We just abort the sending, but we want to check how the generation works
-            composer._action_send_mail(auto_commit=auto_commit)
-        self.mail_status = "sent"
-        return True
+        if self[:1].is_test:
+            # We just abort the sending
+            return
+        # Mails are only created, like the mass mail composer does, and sent
+        # by the mail queue once the chunk is committed. Sending them here
+        # could not be undone if the chunk is rolled back.
+        self.env["mail.mail"].sudo().create(
+            list(composer.get_mail_values(res_ids).values())
+        )
+        self.env.ref("mail.ir_cron_mail_scheduler_action")._trigger()
 
     def _get_mail_tracking_token(self):
         return tools.hmac(self.env(su=True), "automation_oca", self.id)
@@ -242,23 +562,161 @@ class AutomationRecordStep(models.Model):
         ).run()
         return True
 
-    def _cron_automation_steps(self):
-        childs = self.browse()
-        for activity in self.search(
-            [
-                ("state", "=", "scheduled"),
-                ("scheduled_date", "<=", fields.Datetime.now()),
-            ]
+    def _run_action_batch(self):
+        """Execute the server action once for each chunk of records.
+
+        It is only done when the configuration step allows it and
+        ``_run_action`` is not overridden. If a chunk fails, its steps are
+        executed one by one in order to find the failing records.
+        """
+        configuration_step = self.configuration_step_id
+        if not configuration_step.server_action_batch or (
+            self._is_step_method_overridden("action")
         ):
-            childs |= activity.run(trigger_activity=False)
-        childs._trigger_activities()
-        self.search(
-            [
-                ("state", "=", "scheduled"),
-                ("expiry_date", "!=", False),
-                ("expiry_date", "<=", fields.Datetime.now()),
-            ]
-        )._expiry()
+            return self._run_step_per_record()
+        result_ids = []
+        for _model, steps in tools.groupby(self, key=lambda r: r.record_id.model):
+            for chunk in tools.split_every(
+                configuration_step.server_action_batch_size or len(steps),
+                [step.id for step in steps],
+                self.browse,
+            ):
+                try:
+                    with self._step_savepoint():
+                        chunk._run_action_chunk()
+                    result_ids += chunk.ids
+                except Exception:
+                    result_ids += chunk._run_step_per_record().ids
+        return self.browse(result_ids)
+
+    def _run_action_chunk(self):
+        self.configuration_step_id.server_action_id.with_context(
+            active_model=self[:1].record_id.model,
+            active_ids=self.mapped("record_id.res_id"),
+        ).run()
+
+    def _cron_automation_steps(self, batch_size=None, time_budget=None):
+        """Execute the due steps and expire the outdated ones.
+
+        Steps are processed in chunks and the transaction is committed after
+        each one. Due steps are claimed before being executed, so several
+        workers can execute them at the same time. When the time budget is
+        exhausted, the cron is triggered again in order to continue with the
+        remaining steps.
+        """
+        thread = threading.current_thread()
+        thread.automation_rollback_count = 0
+        executed, expired = self._cron_process_steps(
+            batch_size or self._get_cron_batch_size(),
+            self._get_cron_deadline(time_budget),
+        )
+        _logger.info(
+            "Automation steps: %s executed, %s expired, %s savepoint rollbacks",
+            executed,
+            expired,
+            thread.automation_rollback_count,
+        )
+
+    def _cron_process_steps(self, batch_size, deadline):
+        executed = expired = 0
+        now = fields.Datetime.now()
+        while True:
+            steps = self._claim_due_steps(now, batch_size)
+            if not steps:
+                break
+            # Other workers must see the claim before we execute the steps
+            self._cron_commit()
+            steps._run_batch()
+            self._cron_commit()
+            # The commit doesn't clear the cache, that would grow with every
+            # chunk of steps, their records and their childs
+            self.env.invalidate_all()
+            executed += len(steps)
+            if self._cron_deadline_reached(deadline):
+                self._cron_continue("automation_oca.cron_step_execute")
+                return executed, expired
+        while True:
+            # Expired steps are claimed too, so they cannot be executed by
+            # another worker meanwhile
+            steps = self._claim_due_steps(now, batch_size, date_field="expiry_date")
+            if not steps:
+                break
+            steps._expiry()
+            self._cron_commit()
+            self.env.invalidate_all()
+            expired += len(steps)
+            if self._cron_deadline_reached(deadline):
+                self._cron_continue("automation_oca.cron_step_execute")
+                return executed, expired
+        return executed, expired
+
+    @api.model
+    def _get_claim_timeout(self):
+        """Claims older than this timeout are considered stale,
+        as the worker that claimed the steps is probably dead"""
+        return timedelta(
+            minutes=int(
+                self.env["ir.config_parameter"]
+                .sudo()
+                .get_param("automation_oca.claim_timeout", 60)
+            )
+        )
+
+    @api.model
+    def _claim_due_steps(self, now, limit, date_field="scheduled_date"):
+        """Claim the scheduled steps whose ``date_field`` is before ``now``.
+
+        Steps claimed by other workers are ignored unless the claim is stale.
+        Rows locked by other transactions are skipped, so two workers can
+        never claim the same step. The claim is dated when it is done, as
+        ``now`` might be old on long executions.
+        """
+        self.flush_model(["state", date_field, "claimed_at"])
+        self.env.cr.execute(*self._get_claim_query(now, limit, date_field))
+        steps = self.browse([row[0] for row in self.env.cr.fetchall()])
+        steps.invalidate_recordset(["claimed_at"])
+        return steps
+
+    @api.model
+    def _get_claim_query(self, now, limit, date_field="scheduled_date"):
+        """Return the query and the parameters of ``_claim_due_steps``"""
+        claim_date = fields.Datetime.now()
+        return (
+            """
+            UPDATE automation_record_step
+            SET claimed_at = %(claim_date)s
+            WHERE id IN (
+                SELECT id
+                FROM automation_record_step
+                WHERE state = 'scheduled'
+                    AND {date_field} IS NOT NULL
+                    AND {date_field} <= %(now)s
+                    AND (claimed_at IS NULL OR claimed_at < %(stale_date)s)
+                ORDER BY {date_field}, id
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+            """.format(
+                date_field=date_field
+            ),
+            {
+                "now": now,
+                "claim_date": claim_date,
+                "stale_date": claim_date - self._get_claim_timeout(),
+                "limit": limit,
+            },
+        )
+
+    @api.model
+    def _search_by_message_ids(self, message_ids):
+        """Return the steps whose mail has one of the given Message-IDs"""
+        message_ids = {
+            message_id.strip() for message_id in message_ids if message_id.strip()
+        }
+        if not message_ids:
+            return self.browse()
+        return self.search([("message_id", "in", list(message_ids))])
 
     def _trigger_activities(self):
         # Creates a cron trigger.
@@ -0,0 +1,279 @@
+# Copyright 2024 Dixmit
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from odoo import api, fields, models
+from odoo.tools.sql import create_index
+
+DAILY_STATES = ["done", "error", "expired", "rejected", "cancel"]
+MAIL_COUNTERS = ["mail_sent", "mail_open", "mail_click", "mail_reply", "mail_bounce"]
+DAILY_COUNTERS = {
+    "done": "state = 'done'",
+    "error": "state = 'error'",
+    "expired": "state = 'expired'",
+    "rejected": "state = 'rejected'",
+    "cancel": "state = 'cancel'",
+    "mail_sent": "mail_status IS NOT NULL",
+    "mail_open": "mail_opened_on IS NOT NULL",
+    "mail_click": "mail_clicked_on IS NOT NULL",
+    "mail_reply": "mail_replied_on IS NOT NULL",
+    "mail_bounce": "mail_status = 'bounce'",
+}
+# Fields of automation.record.step that change the statistics when written
+DAILY_TRIGGER_FIELDS = {
+    "state",
+    "processed_on",
+    "mail_status",
+    "mail_opened_on",
+    "mail_clicked_on",
+    "mail_replied_on",
+}
+# Overlap between two reconciliations of the tracking, for transactions
+# committed after the previous one started
+TRACKING_MARGIN = timedelta(hours=1)
+
+
+class AutomationStepStatDaily(models.Model):
+    """Processed steps and mail funnel by configuration step and hour, so
+    they can be grouped by day on any timezone"""
+
+    _name = "automation.step.stat.daily"
+    _description = "Automation step daily statistics"
+    _log_access = False
+    _order = "date DESC"
+
+    configuration_id = fields.Many2one(
+        "automation.configuration", readonly=True, ondelete="cascade"
+    )
+    configuration_step_id = fields.Many2one(
+        "automation.configuration.step",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    step_type = fields.Selection(related="configuration_step_id.step_type")
+    date = fields.Datetime("Processed on", required=True, readonly=True)
+    done = fields.Integer(readonly=True)
+    error = fields.Integer(readonly=True)
+    expired = fields.Integer(readonly=True)
+    rejected = fields.Integer(readonly=True)
+    cancel = fields.Integer(readonly=True)
+    mail_sent = fields.Integer(string="Sent", readonly=True)
+    mail_open = fields.Integer(string="Opened", readonly=True)
+    mail_click = fields.Integer(string="Clicked", readonly=True)
+    mail_reply = fields.Integer(string="Replied", readonly=True)
+    mail_bounce = fields.Integer(string="Bounced", readonly=True)
+
+    def init(self):
+        create_index(
+            self.env.cr,
+            "automation_step_stat_daily_step_date_index",
+            self._table,
+            ["configuration_step_id", "date"],
+        )
+        # Count everything when the table is created or a column is added
+        self.env.cr.execute(
+            """
+            SELECT NOT EXISTS (SELECT 1 FROM automation_step_stat_daily)
+                OR EXISTS (
+                    SELECT 1 FROM automation_step_stat_daily
+                    WHERE {}
+                )
+            """.format(
+                " OR ".join(
+                    "%s IS NULL" % column for column in ["date"] + list(DAILY_COUNTERS)
+                )
+            )
+        )
+        if self.env.cr.fetchone()[0]:
+            self._reconcile()
+
+    @api.model
+    def _count_steps(self, step_ids):
+        """Return the counters of the processed steps of ``step_ids`` as a
+        Counter of (configuration_id, configuration_step_id, hour, counter)"""
+        if not step_ids:
+            return Counter()
+        self.env.cr.execute(
+            """
+            SELECT configuration_id, configuration_step_id,
+                date_trunc('hour', processed_on), {counts}
+            FROM automation_record_step
+            WHERE id IN %s
+                AND is_test IS NOT TRUE
+                AND processed_on IS NOT NULL
+            GROUP BY configuration_id, configuration_step_id,
+                date_trunc('hour', processed_on)
+            """.format(
+                counts=self._get_count_columns()
+            ),
+            (tuple(step_ids),),
+        )
+        result = Counter()
+        for row in self.env.cr.fetchall():
+            for counter, count in zip(DAILY_COUNTERS, row[3:]):
+                if count:
+                    result[row[:3] + (counter,)] = count
+        return result
+
+    @api.model
+    def _get_count_columns(self):
+        return ", ".join(
+            "COUNT(*) FILTER (WHERE {})".format(condition)
+            for condition in DAILY_COUNTERS.values()
+        )
+
+    @api.model
+    def _increment(self, before, after):
+        """Insert the difference between two results of ``_count_steps``"""
+        deltas = defaultdict(lambda: dict.fromkeys(DAILY_COUNTERS, 0))
+        for key in set(before) | set(after):
+            delta = after[key] - before[key]
+            if delta:
+                deltas[key[:3]][key[3]] += delta
+        if not deltas:
+            return
+        values = []
+        for key, counters in deltas.items():
+            values += list(key) + [counters[counter] for counter in DAILY_COUNTERS]
+        placeholders = ", ".join(
+            ["(%s)" % ", ".join(["%s"] * (len(DAILY_COUNTERS) + 3))] * len(deltas)
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO automation_step_stat_daily (
+                configuration_id, configuration_step_id, date, {columns}
+            )
+            VALUES {placeholders}
+            """.format(
+                columns=", ".join(DAILY_COUNTERS),
+                placeholders=placeholders,
+            ),
+            values,
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _reconcile(self, configuration_step_ids=None):
+        """Recount the statistics of the configuration steps, all by default"""
+        self.env.flush_all()
+        where = ""
+        params = []
+        if configuration_step_ids is not None:
+            if not configuration_step_ids:
+                return
+            where = "AND configuration_step_id IN %s"
+            params.append(tuple(configuration_step_ids))
+        self.env.cr.execute(
+            "DELETE FROM automation_step_stat_daily WHERE TRUE {}".format(where),
+            params,
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO automation_step_stat_daily (
+                configuration_id, configuration_step_id, date, {columns}
+            )
+            SELECT configuration_id, configuration_step_id,
+                date_trunc('hour', processed_on), {counts}
+            FROM automation_record_step
+            WHERE is_test IS NOT TRUE
+                AND processed_on IS NOT NULL
+                {where}
+            GROUP BY configuration_id, configuration_step_id,
+                date_trunc('hour', processed_on)
+            """.format(
+                columns=", ".join(DAILY_COUNTERS),
+                counts=self._get_count_columns(),
+                where=where,
+            ),
+            params,
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _compact(self):
+        """Merge the rows of each configuration step and hour into one"""
+        self.env.cr.execute(
+            """
+            WITH compacted AS (
+                DELETE FROM automation_step_stat_daily
+                WHERE (configuration_step_id, date) IN (
+                    SELECT configuration_step_id, date
+                    FROM automation_step_stat_daily
+                    GROUP BY configuration_step_id, date
+                    HAVING COUNT(*) > 1
+                )
+                RETURNING configuration_id, configuration_step_id, date, {columns}
+            )
+            INSERT INTO automation_step_stat_daily (
+                configuration_id, configuration_step_id, date, {columns}
+            )
+            SELECT MAX(configuration_id), configuration_step_id, date, {sums}
+            FROM compacted
+            GROUP BY configuration_step_id, date
+            """.format(
+                columns=", ".join(DAILY_COUNTERS),
+                sums=", ".join("SUM(%s)" % counter for counter in DAILY_COUNTERS),
+            )
+        )
+        self.invalidate_model()
+
+    @api.model
+    def _refresh_tracking(self):
+        """Recount the hours of the mails tracked since the last refresh, in
+        case an increment was lost"""
+        self.env.flush_all()
+        param = self.env["ir.config_parameter"].sudo()
+        since = param.get_param("automation_oca.stat_tracking_date")
+        refresh_date = self.env.cr.now()
+        buckets = """
+            SELECT DISTINCT configuration_step_id, date_trunc('hour', processed_on)
+            FROM automation_record_step
+            WHERE mail_status IS NOT NULL
+                AND is_test IS NOT TRUE
+                AND processed_on IS NOT NULL
+                {where}
+        """.format(
+            where="AND write_date >= %(since)s" if since else ""
+        )
+        params = {
+            "since": since and fields.Datetime.to_datetime(since) - TRACKING_MARGIN
+        }
+        self.env.cr.execute(
+            """
+            DELETE FROM automation_step_stat_daily
+            WHERE (configuration_step_id, date) IN ({buckets})
+            """.format(
+                buckets=buckets
+            ),
+            params,
+        )
+        self.env.cr.execute(
+            """
+            INSERT INTO automation_step_stat_daily (
+                configuration_id, configuration_step_id, date, {columns}
+            )
+            SELECT configuration_id, configuration_step_id,
+                date_trunc('hour', processed_on), {counts}
+            FROM automation_record_step
+            WHERE is_test IS NOT TRUE
+                AND processed_on IS NOT NULL
+                AND (
+                    configuration_step_id, date_trunc('hour', processed_on)
+                ) IN ({buckets})
+            GROUP BY configuration_id, configuration_step_id,
+                date_trunc('hour', processed_on)
+            """.format(
+                columns=", ".join(DAILY_COUNTERS),
+                counts=self._get_count_columns(),
+                buckets=buckets,
+            ),
+            params,
+        )
+        param.set_param(
+            "automation_oca.stat_tracking_date",
+            fields.Datetime.to_string(refresh_date),
+        )
+        self.invalidate_model()
@@ -1,6 +1,8 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from collections import defaultdict
+
 from odoo import api, fields, models
 
 
@@ -15,6 +17,15 @@ class LinkTrackerClick(models.Model):
         related="automation_record_step_id.configuration_id", store=True
     )
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        counters = defaultdict(lambda: defaultdict(int))
+        for record in records.filtered("automation_configuration_id"):
+            counters[record.automation_configuration_id.id]["click_count"] += 1
+        self.env["automation.configuration.stat"]._increment(counters)
+        return records
+
     @api.model
     def add_click(self, code, automation_record_step_id=False, **route_values):
         if automation_record_step_id:
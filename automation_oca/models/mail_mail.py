@@ -19,7 +19,9 @@ class MailMail(models.Model):
     def create(self, values_list):
         records = super().create(values_list)
         for record in records.filtered("automation_record_step_id"):
-            record.automation_record_step_id.message_id = record.message_id
+            record.automation_record_step_id.message_id = (
+                record.message_id and record.message_id.strip()
+            )
         return records
 
     def _send_prepare_body(self):
@@ -1,13 +1,63 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+import logging
+
 from odoo import api, models, tools
 
+_logger = logging.getLogger(__name__)
+
 
 class MailThread(models.AbstractModel):
 
     _inherit = "mail.thread"
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super().create(vals_list)
+        records._automation_realtime_register()
+        return records
+
+    def write(self, vals):
+        result = super().write(vals)
+        self._automation_realtime_register()
+        return result
+
+    def _automation_realtime_register(self):
+        """Keep the records in order to check them against the configurations
+        with real time enrollment at commit time"""
+        if not self:
+            return
+        Configuration = self.env["automation.configuration"]
+        if not Configuration._get_realtime_configuration_ids(self._name):
+            return
+        key = "automation_oca.realtime.%s" % self._name
+        if key not in self.env.cr.precommit.data:
+            self.env.cr.precommit.add(self._automation_realtime_enroll)
+        self.env.cr.precommit.data.setdefault(key, set()).update(self.ids)
+
+    def _automation_realtime_enroll(self):
+        res_ids = self.env.cr.precommit.data.pop(
+            "automation_oca.realtime.%s" % self._name, set()
+        )
+        Configuration = self.env["automation.configuration"].sudo()
+        for configuration in Configuration.browse(
+            Configuration._get_realtime_configuration_ids(self._name)
+        ):
+            # An enrollment error must not prevent the commit of the user
+            # changes. The savepoint flushes the enrollment, as precommit
+            # hooks are executed after the flush
+            try:
+                with self.env.cr.savepoint():
+                    configuration._run_realtime_automation(res_ids)
+            except Exception:
+                _logger.exception(
+                    "Error while enrolling %s records on automation "
+                    "configuration %s",
+                    self._name,
+                    configuration.id,
+                )
+
     @api.model
     def _routing_handle_bounce(self, email_message, message_dict):
         """We want to mark the bounced email"""
@@ -16,8 +66,8 @@ class MailThread(models.AbstractModel):
         )
         bounced_msg_id = message_dict.get("bounced_msg_id")
         if bounced_msg_id:
-            self.env["automation.record.step"].search(
-                [("message_id", "in", bounced_msg_id)]
+            self.env["automation.record.step"]._search_by_message_ids(
+                bounced_msg_id
             )._set_mail_bounced()
         return result
 
@@ -32,9 +82,8 @@ class MailThread(models.AbstractModel):
             )
             msg_references = tools.mail_header_msgid_re.findall(thread_references)
             if msg_references:
-                records = self.env["automation.record.step"].search(
-                    [("message_id", "in", msg_references)]
-                )
+                records = self.env["automation.record.step"]
+                records = records._search_by_message_ids(msg_references)
                 records._set_mail_open()
                 records._set_mail_reply()
         return super(MailThread, self)._message_route_process(
@@ -3,3 +3,4 @@ from . import test_automation_activity
 from . import test_automation_base
 from . import test_automation_mail
 from . import test_automation_security
+from . import test_automation_benchmark
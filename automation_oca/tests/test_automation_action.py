@@ -203,3 +203,109 @@ class TestAutomationAction(AutomationTestCase):
                 ]
             ),
         )
+
+    def test_batch_execution(self):
+        """
+        All the due steps of a configuration step are executed at once,
+        and the childs of all of them are created
+        """
+        activity = self.create_server_action()
+        child_activity = self.create_server_action(parent_id=activity.id)
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        self.assertFalse(self.partner_01.comment)
+        self.assertFalse(self.partner_02.comment)
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(2, len(record_activities))
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+        record_child_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", child_activity.id)]
+        )
+        self.assertEqual(2, len(record_child_activities))
+        self.assertEqual(record_activities, record_child_activities.parent_id)
+        self.assertEqual({0}, set(record_activities.mapped("parent_position")))
+        self.assertEqual({1}, set(record_child_activities.mapped("parent_position")))
+
+    def test_batch_server_action(self):
+        """
+        Server actions marked as batch are executed for all the records at once
+        """
+        activity = self.create_server_action(
+            server_action_batch=True, server_action_batch_size=1
+        )
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        self.assertFalse(self.partner_01.comment)
+        self.assertFalse(self.partner_02.comment)
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+
+    def test_batch_server_action_error(self):
+        """
+        When a batch fails, the steps are executed one by one,
+        so the error is stored on each failing step
+        """
+        activity = self.create_server_action(
+            server_action_id=self.error_action.id, server_action_batch=True
+        )
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(2, len(record_activities))
+        self.assertEqual({"error"}, set(record_activities.mapped("state")))
+        self.assertTrue(all(record_activities.mapped("error_trace")))
+
+    def test_x2many_domain(self):
+        """
+        We will check that the domain of the step is applied on x2many paths
+        and on archived records
+        """
+        category = self.env["res.partner.category"].create({"name": "Automation"})
+        self.partner_01.category_id = category
+        activity = self.create_server_action(
+            domain="[('category_id.name', '=', 'Automation')]"
+        )
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        (self.partner_01 | self.partner_02).write({"active": False})
+        self.env["automation.record.step"]._cron_automation_steps()
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(
+            "done",
+            record_activities.filtered(
+                lambda r: r.record_id.res_id == self.partner_01.id
+            ).state,
+        )
+        self.assertEqual(
+            "rejected",
+            record_activities.filtered(
+                lambda r: r.record_id.res_id == self.partner_02.id
+            ).state,
+        )
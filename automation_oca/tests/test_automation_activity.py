@@ -1,6 +1,8 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from unittest.mock import patch
+
 from odoo.tests import Form
 
 from .common import AutomationTestCase
@@ -44,6 +46,64 @@ class TestAutomationActivity(AutomationTestCase):
             ]
         )
 
+    def test_activity_execution_generic_user(self):
+        """
+        We will check that the activities of several records are assigned
+        to the user defined on each record
+        """
+        user = self.env["res.users"].create(
+            {"name": "Automation user", "login": "automation_user"}
+        )
+        self.partner_01.user_id = user
+        activity = self.create_activity_action(
+            activity_user_type="generic",
+            activity_user_field_id=self.env.ref("base.field_res_partner__user_id").id,
+        )
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+        self.assertEqual(user, self.partner_01.activity_ids.user_id)
+        self.assertEqual(self.env.user, self.partner_02.activity_ids.user_id)
+        self.assertEqual(
+            record_activities,
+            (
+                self.partner_01.activity_ids | self.partner_02.activity_ids
+            ).automation_record_step_id,
+        )
+
+    def test_activity_execution_batch_error(self):
+        """
+        We will check that the steps are executed one by one when the
+        activities cannot be created at once
+        """
+        activity = self.create_activity_action()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        with patch.object(
+            type(self.env["automation.record.step"]),
+            "_run_activity_chunk",
+            side_effect=ValueError("Batch error"),
+        ):
+            self.env["automation.record.step"]._cron_automation_steps()
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+        self.assertTrue(self.partner_01.activity_ids)
+        self.assertTrue(self.partner_02.activity_ids)
+
     def test_activity_execution_child(self):
         """
         We will check the execution of the hild task (activity_done) is only scheduled
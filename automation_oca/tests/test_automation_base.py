@@ -1,14 +1,19 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from unittest.mock import patch
 
 from freezegun import freeze_time
 
+from odoo import fields
 from odoo.exceptions import ValidationError
 from odoo.tests import Form
+from odoo.tools import mute_logger
 from odoo.tools.safe_eval import safe_eval
 
+from odoo.addons.automation_oca.models import automation_configuration
+
 from .common import AutomationTestCase
 
 
@@ -65,6 +70,74 @@ class TestAutomationBase(AutomationTestCase):
                 self.configuration.next_execution_date, datetime(2022, 1, 1, 0, 0, 0)
             )
 
+    def test_execution_interval(self):
+        """
+        We want to check that periodic configurations are only executed
+        when they are due
+        """
+        self.configuration.write(
+            {
+                "execution_interval": 30,
+                "execution_interval_type": "minutes",
+                "editable_domain": "[('name', '=like', 'Demo partner%')]",
+            }
+        )
+        self.configuration.start_automation()
+        cron = self.env.ref("automation_oca.cron_configuration_run")
+        self.env["automation.configuration"].cron_automation()
+        self.assertEqual(
+            2,
+            self.env["automation.record"].search_count(
+                [("configuration_id", "=", self.configuration.id)]
+            ),
+        )
+        next_execution_date = self.configuration.next_execution_date
+        self.assertGreater(
+            next_execution_date, fields.Datetime.now() + timedelta(minutes=29)
+        )
+        self.assertLess(
+            next_execution_date, fields.Datetime.now() + timedelta(minutes=31)
+        )
+        self.assertTrue(
+            self.env["ir.cron.trigger"].search(
+                [("cron_id", "=", cron.id), ("call_at", "=", next_execution_date)]
+            )
+        )
+        self.env["res.partner"].create({"name": "Demo partner 3"})
+        self.env["automation.configuration"].cron_automation()
+        self.assertEqual(
+            2,
+            self.env["automation.record"].search_count(
+                [("configuration_id", "=", self.configuration.id)]
+            ),
+        )
+
+    def test_execution_interval_change(self):
+        """
+        The next execution is computed again from the last run when the
+        interval changes
+        """
+        self.configuration.write(
+            {"execution_interval": 6, "execution_interval_type": "hours"}
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        last_execution_date = self.configuration.next_execution_date - timedelta(
+            hours=6
+        )
+        self.configuration.write(
+            {"execution_interval": 30, "execution_interval_type": "minutes"}
+        )
+        self.assertEqual(
+            self.configuration.next_execution_date,
+            last_execution_date + timedelta(minutes=30),
+        )
+        self.configuration.execution_interval = 2
+        self.assertEqual(
+            self.configuration.next_execution_date,
+            last_execution_date + timedelta(minutes=2),
+        )
+
     def test_cron_no_duplicates(self):
         """
         We want to check that the records are generated only once, not twice
@@ -97,6 +170,7 @@ class TestAutomationBase(AutomationTestCase):
             ),
         )
 
+        self.configuration.next_execution_date = fields.Datetime.now()
         self.env["automation.configuration"].cron_automation()
         self.assertEqual(
             1,
@@ -129,6 +203,186 @@ class TestAutomationBase(AutomationTestCase):
             ),
         )
 
+    def test_cron_configuration_error(self):
+        """
+        We want to check that an error on a configuration doesn't prevent
+        the enrollment of the others
+        """
+        configuration = self.env["automation.configuration"].create(
+            {
+                "name": "Wrong configuration",
+                "model_id": self.env.ref("base.model_res_partner").id,
+                "is_periodic": True,
+                "editable_domain": "[('unexisting_field', '=', 1)]",
+            }
+        )
+        configuration.start_automation()
+        self.configuration.start_automation()
+        with mute_logger("odoo.addons.automation_oca.models.automation_configuration"):
+            self.env["automation.configuration"].cron_automation()
+        self.assertFalse(
+            self.env["automation.record"].search(
+                [("configuration_id", "=", configuration.id)]
+            )
+        )
+        self.assertTrue(
+            self.env["automation.record"].search(
+                [("configuration_id", "=", self.configuration.id)]
+            )
+        )
+
+    def test_cron_chunks(self):
+        """
+        We want to check that all the records are processed when the crons
+        are executed in several chunks
+        """
+        activity = self.create_server_action()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation(batch_size=1)
+        self.assertEqual(
+            2,
+            self.env["automation.record"].search_count(
+                [("configuration_id", "=", self.configuration.id)]
+            ),
+        )
+        self.env["automation.record.step"]._cron_automation_steps(batch_size=1)
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+
+    def test_create_records(self):
+        """
+        We want to check that several records are enrolled at once with all
+        their direct steps
+        """
+        activity_1 = self.create_server_action()
+        activity_2 = self.create_activity_action()
+        self.create_server_action(parent_id=activity_1.id)
+        partners = self.partner_01 | self.partner_02
+        records = self.configuration._create_records(partners)
+        self.assertEqual(partners.ids, records.mapped("res_id"))
+        for record in records:
+            self.assertEqual(
+                activity_1 | activity_2,
+                record.automation_step_ids.configuration_step_id,
+            )
+            self.assertEqual(
+                {"scheduled"}, set(record.automation_step_ids.mapped("state"))
+            )
+
+    def test_record_state(self):
+        """
+        The state of the records follows the number of scheduled steps,
+        and it can be recomputed
+        """
+        activity = self.create_server_action()
+        self.create_server_action(parent_id=activity.id)
+        record = self.configuration._create_records(self.partner_01)
+        self.assertEqual(1, record.scheduled_step_count)
+        self.assertEqual("run", record.state)
+        self.env["automation.record.step"]._cron_automation_steps()
+        record.invalidate_recordset()
+        # The action is done and its child is scheduled
+        self.assertEqual(1, record.scheduled_step_count)
+        self.assertEqual("run", record.state)
+        record.automation_step_ids.filtered(lambda r: r.state == "scheduled").cancel()
+        self.assertEqual(0, record.scheduled_step_count)
+        self.assertEqual("done", record.state)
+        self.env.cr.execute(
+            "UPDATE automation_record SET scheduled_step_count = 3, state = 'run' "
+            "WHERE id = %s",
+            (record.id,),
+        )
+        self.env["automation.record"]._recompute_state(record.ids)
+        self.assertEqual(0, record.scheduled_step_count)
+        self.assertEqual("done", record.state)
+
+    def test_create_records_duplicated(self):
+        """
+        We want to check that a record cannot be enrolled twice, even when
+        the candidates were computed before the first enrollment
+        """
+        activity = self.create_server_action()
+        records = self.configuration._create_records(self.partner_01)
+        self.assertEqual(1, len(records))
+        self.assertEqual("run", records.state)
+        self.assertEqual(activity, records.automation_step_ids.configuration_step_id)
+        records = self.configuration._create_records(self.partner_01 | self.partner_02)
+        self.assertEqual(self.partner_02.ids, records.mapped("res_id"))
+        self.assertEqual(
+            1,
+            self.env["automation.record"].search_count(
+                [
+                    ("configuration_id", "=", self.configuration.id),
+                    ("res_id", "=", self.partner_01.id),
+                ]
+            ),
+        )
+        # Test records are not affected
+        self.assertTrue(
+            self.configuration._create_records(self.partner_01, is_test=True)
+        )
+
+    def test_cron_time_budget(self):
+        """
+        When the time budget is exhausted, the remaining steps are left
+        for a new execution of the cron
+        """
+        activity = self.create_server_action()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        cron = self.env.ref("automation_oca.cron_step_execute")
+        triggers = self.env["ir.cron.trigger"].search([("cron_id", "=", cron.id)])
+        self.env["automation.record.step"]._cron_automation_steps(
+            batch_size=1, time_budget=1e-9
+        )
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(
+            ["done", "scheduled"], sorted(record_activities.mapped("state"))
+        )
+        self.assertTrue(
+            self.env["ir.cron.trigger"].search([("cron_id", "=", cron.id)]) - triggers
+        )
+        self.env["automation.record.step"]._cron_automation_steps()
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+
+    def test_claim_due_steps(self):
+        """
+        Steps claimed by a worker cannot be claimed by another one
+        until the claim is stale
+        """
+        self.create_server_action()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        now = fields.Datetime.now()
+        step_obj = self.env["automation.record.step"]
+        first_steps = step_obj._claim_due_steps(now, 1)
+        self.assertEqual(1, len(first_steps))
+        self.assertTrue(first_steps.claimed_at)
+        second_steps = step_obj._claim_due_steps(now, 10)
+        self.assertEqual(1, len(second_steps))
+        self.assertNotEqual(first_steps, second_steps)
+        self.assertFalse(step_obj._claim_due_steps(now, 10))
+        # A stale claim can be recovered by another worker
+        first_steps.write({"claimed_at": now - timedelta(days=1)})
+        self.assertEqual(first_steps, step_obj._claim_due_steps(now, 10))
+        self.assertGreater(first_steps.claimed_at, now - timedelta(days=1))
+
     def test_filter(self):
         """
         We want to see that the records are only generated for
@@ -173,6 +427,57 @@ class TestAutomationBase(AutomationTestCase):
         self.assertEqual(record.state, "error")
         self.assertTrue(record.error_trace)
 
+    def test_exception_sql(self):
+        """
+        Check that a database error on a step doesn't abort the other steps
+        """
+        sql_error_action = self.env["ir.actions.server"].create(
+            {
+                "name": "Demo action",
+                "state": "code",
+                "model_id": self.env.ref("base.model_res_partner").id,
+                "code": "env.cr.execute('SELECT unexisting_column FROM res_partner')",
+            }
+        )
+        error_activity = self.create_server_action(server_action_id=sql_error_action.id)
+        activity = self.create_server_action()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        error_record = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", error_activity.id)]
+        )
+        self.assertEqual(error_record.state, "error")
+        self.assertTrue(error_record.error_trace)
+        record = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(record.state, "done")
+        self.assertFalse(self.partner_01.comment)
+
+    def test_exception_domain(self):
+        """
+        Check that a wrong domain on a step doesn't abort the other steps
+        """
+        error_activity = self.create_server_action(
+            domain="[('unexisting_field', '=', 1)]"
+        )
+        activity = self.create_server_action()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        error_record = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", error_activity.id)]
+        )
+        self.assertEqual(error_record.state, "error")
+        self.assertTrue(error_record.error_trace)
+        record = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(record.state, "done")
+
     def test_record_resource_information(self):
         """
         Check the record computed fields of record
@@ -235,6 +540,67 @@ class TestAutomationBase(AutomationTestCase):
         self.assertEqual(1, self.configuration.record_count)
         self.assertEqual(0, self.configuration.record_test_count)
 
+    def test_counter_new_configuration(self):
+        """
+        Check that the counters are created with the configuration, and
+        never by reading them
+        """
+        stats = self.env["automation.configuration.stat"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertEqual(1, len(stats))
+        stats.unlink()
+        self.configuration.invalidate_recordset()
+        self.assertEqual(0, self.configuration.record_count)
+        self.assertFalse(
+            self.env["automation.configuration.stat"].search(
+                [("configuration_id", "=", self.configuration.id)]
+            )
+        )
+
+    def test_counter_reconcile(self):
+        """
+        Check that the counters are updated incrementally and recounted
+        """
+        self.create_server_action()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.assertEqual(0, self.configuration.record_count)
+        self.env["automation.configuration"].cron_automation()
+        self.configuration.invalidate_recordset()
+        self.assertEqual(1, self.configuration.record_count)
+        self.assertEqual(1, self.configuration.record_run_count)
+        self.assertEqual(0, self.configuration.record_done_count)
+        self.env["automation.record.step"]._cron_automation_steps()
+        self.configuration.invalidate_recordset()
+        self.assertEqual(1, self.configuration.record_count)
+        self.assertEqual(0, self.configuration.record_run_count)
+        self.assertEqual(1, self.configuration.record_done_count)
+        self.assertEqual(1, self.configuration.activity_action_count)
+        stats = self.env["automation.configuration.stat"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertGreater(len(stats), 1)
+        self.env["automation.configuration.stat"]._cron_compact()
+        self.assertEqual(
+            1,
+            self.env["automation.configuration.stat"].search_count(
+                [("configuration_id", "=", self.configuration.id)]
+            ),
+        )
+        self.configuration.invalidate_recordset()
+        self.assertEqual(1, self.configuration.record_count)
+        self.assertEqual(1, self.configuration.record_done_count)
+        self.assertEqual(1, self.configuration.activity_action_count)
+        self.env.cr.execute(
+            "UPDATE automation_configuration_stat SET record_count = 10 "
+            "WHERE configuration_id = %s",
+            (self.configuration.id,),
+        )
+        self.env["automation.configuration.stat"]._cron_reconcile()
+        self.configuration.invalidate_recordset()
+        self.assertEqual(1, self.configuration.record_count)
+
     def test_start_configuration_twice_exception(self):
         """
         Check that we cannot start automation twice
@@ -344,6 +710,50 @@ class TestAutomationBase(AutomationTestCase):
         self.assertEqual(1, sum(d["y"] for d in child_activity.graph_data["done"]))
         self.assertEqual(0, sum(d["y"] for d in child_activity.graph_data["error"]))
 
+    def test_graph_window(self):
+        """
+        The graphs are read from the daily statistics, so the window can be
+        extended, and the statistics can be recounted
+        """
+        activity = self.create_server_action()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        record_activity = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        record_activity.processed_on = fields.Datetime.now() + timedelta(days=-20)
+        self.env["automation.step.stat.daily"]._reconcile(activity.ids)
+        activity.invalidate_recordset()
+        self.assertEqual(1, activity.graph_done)
+        self.assertEqual(15, len(activity.graph_data["done"]))
+        self.assertEqual(0, sum(d["y"] for d in activity.graph_data["done"]))
+        activity = activity.with_context(automation_graph_days=30)
+        self.assertEqual(31, len(activity.graph_data["done"]))
+        self.assertEqual(1, sum(d["y"] for d in activity.graph_data["done"]))
+
+    def test_graph_timezone(self):
+        """
+        The graphs group the steps by day on the timezone of the user
+        """
+        activity = self.create_server_action()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.env["automation.record.step"]._cron_automation_steps()
+        record_activity = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        record_activity.processed_on = datetime(2024, 1, 9, 23, 30)
+        self.env["automation.step.stat.daily"]._reconcile(activity.ids)
+        with freeze_time("2024-01-10 12:00:00"):
+            for tz, day in [("UTC", "09 Jan 2024"), ("Asia/Tokyo", "10 Jan 2024")]:
+                graph_data = activity.with_context(tz=tz).graph_data
+                self.assertEqual(
+                    [day], [d["name"] for d in graph_data["done"] if d["y"]]
+                )
+
     def test_schedule_date_computation_hours(self):
         with freeze_time("2022-01-01"):
             activity = self.create_server_action(trigger_interval=1)
@@ -429,6 +839,7 @@ class TestAutomationBase(AutomationTestCase):
             ),
         )
         self.partner_01.email = "t" + self.partner_01.email
+        self.configuration.next_execution_date = fields.Datetime.now()
         self.env["automation.configuration"].cron_automation()
         self.assertEqual(
             2,
@@ -439,6 +850,178 @@ class TestAutomationBase(AutomationTestCase):
             ),
         )
 
+    def test_field_unicity_empty(self):
+        """
+        Records without a value on the unicity field are all enrolled
+        """
+        self.partner_01.email = False
+        self.partner_02.email = False
+        self.configuration.editable_domain = (
+            "[('id', 'in', %s)]" % (self.partner_01 | self.partner_02).ids
+        )
+        self.configuration.field_id = self.env.ref("base.field_res_partner__email")
+        self.assertEqual(
+            2, self.configuration._get_enrollment_estimate()["record_count"]
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        records = self.env["automation.record"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertEqual(
+            (self.partner_01 | self.partner_02).ids, sorted(records.mapped("res_id"))
+        )
+        self.assertFalse(any(records.mapped("dedup_key")))
+        # They are not enrolled again on the next execution
+        self.configuration.next_execution_date = fields.Datetime.now()
+        self.env["automation.configuration"].cron_automation()
+        self.assertEqual(
+            2,
+            self.env["automation.record"].search_count(
+                [("configuration_id", "=", self.configuration.id)]
+            ),
+        )
+
+    def test_field_unicity_chunks(self):
+        partner_03 = self.partner_02.copy({"email": "other@test.com"})
+        self.configuration.editable_domain = (
+            "[('id', 'in', %s)]" % (self.partner_01 | self.partner_02 | partner_03).ids
+        )
+        self.configuration.field_id = self.env.ref("base.field_res_partner__email")
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation(batch_size=1)
+        self.assertEqual(
+            (self.partner_01 | partner_03).ids,
+            sorted(
+                self.env["automation.record"]
+                .search([("configuration_id", "=", self.configuration.id)])
+                .mapped("res_id")
+            ),
+        )
+
+    def test_incremental_enrollment(self):
+        self.configuration.write(
+            {
+                "incremental_enrollment": True,
+                "editable_domain": "[('comment', '=', 'Incremental')]",
+            }
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        self.assertTrue(self.configuration.last_full_scan_date)
+        (self.partner_01 | self.partner_02).write({"comment": "Incremental"})
+        self.env.flush_all()
+        # partner_01 was modified before the last scan
+        self.env.cr.execute(
+            "UPDATE res_partner SET write_date = '2000-01-01' WHERE id = %s",
+            (self.partner_01.id,),
+        )
+        self.configuration.last_scan_date = fields.Datetime.now() - timedelta(hours=1)
+        self.configuration.next_execution_date = fields.Datetime.now()
+        self.env["automation.configuration"].cron_automation()
+        records = self.env["automation.record"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertEqual(self.partner_02.ids, records.mapped("res_id"))
+        # The full scan finds the remaining records
+        self.configuration.last_full_scan_date -= timedelta(hours=25)
+        self.configuration.next_execution_date = fields.Datetime.now()
+        self.env["automation.configuration"].cron_automation()
+        records = self.env["automation.record"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertEqual(
+            (self.partner_01 | self.partner_02).ids, sorted(records.mapped("res_id"))
+        )
+
+    def test_realtime_enrollment(self):
+        self.configuration.write(
+            {
+                "realtime_enrollment": True,
+                "editable_domain": "[('comment', '=', 'Realtime')]",
+            }
+        )
+        self.configuration.start_automation()
+        partner = self.env["res.partner"].create(
+            {"name": "Realtime partner", "comment": "Realtime"}
+        )
+        self.partner_01.comment = "Realtime"
+        self.partner_02.comment = "Other"
+        self.env.cr.flush()
+        records = self.env["automation.record"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertEqual(
+            (self.partner_01 | partner).ids, sorted(records.mapped("res_id"))
+        )
+        # Nothing happens when the configuration is stopped
+        self.configuration.done_automation()
+        self.partner_02.comment = "Realtime"
+        self.env.cr.flush()
+        self.assertEqual(
+            2,
+            self.env["automation.record"].search_count(
+                [("configuration_id", "=", self.configuration.id)]
+            ),
+        )
+
+    def test_realtime_enrollment_unicity(self):
+        """
+        The unicity of the records enrolled in real time uses the current
+        values of the records written meanwhile
+        """
+        self.configuration.write(
+            {
+                "realtime_enrollment": True,
+                "editable_domain": "[('comment', '=', 'Realtime')]",
+                "field_id": self.env.ref("base.field_res_partner__email").id,
+            }
+        )
+        self.configuration.start_automation()
+        self.partner_01.comment = "Realtime"
+        self.env.cr.flush()
+        self.partner_01.email = "other@test.com"
+        self.env.cr.flush()
+        self.partner_02.comment = "Realtime"
+        self.env.cr.flush()
+        records = self.env["automation.record"].search(
+            [("configuration_id", "=", self.configuration.id)]
+        )
+        self.assertEqual(
+            (self.partner_01 | self.partner_02).ids, sorted(records.mapped("res_id"))
+        )
+
+    def test_field_unicity_same_chunk(self):
+        partner_03 = self.partner_02.copy({"email": "other@test.com"})
+        partners = self.partner_01 | self.partner_02 | partner_03
+        self.configuration.field_id = self.env.ref("base.field_res_partner__email")
+        records = self.configuration._create_records(partners)
+        self.assertEqual((self.partner_01 | partner_03).ids, records.mapped("res_id"))
+        self.assertEqual(2, len(set(records.mapped("dedup_key"))))
+        self.assertFalse(
+            self.configuration._get_automation_records_to_create(
+                res_ids=self.partner_02.ids
+            )
+        )
+
+    def test_eval_domain(self):
+        Configuration = self.env["automation.configuration"]
+        domain = Configuration._eval_domain("[('id', '=', 1)]")
+        domain.append(("name", "=", "Changed"))
+        with patch.object(
+            automation_configuration, "safe_eval", wraps=safe_eval
+        ) as mock_eval:
+            self.assertEqual(
+                [("id", "=", 1)], Configuration._eval_domain("[('id', '=', 1)]")
+            )
+            mock_eval.assert_not_called()
+            # Domains using the evaluation context are not cached
+            self.assertEqual(
+                [("id", "=", self.env.uid)],
+                Configuration._eval_domain("[('id', '=', user.id)]"),
+            )
+            mock_eval.assert_called_once()
+
     def test_configuration_filter_domain(self):
         domain = [("partner_id", "=", self.partner_01.id)]
         self.assertFalse(self.configuration.filter_id)
@@ -485,6 +1068,34 @@ class TestAutomationBase(AutomationTestCase):
         with self.assertRaises(ValidationError):
             self.create_server_action(parent_id=False, trigger_type="after_step")
 
+    def test_estimate(self):
+        """
+        We want to check that the estimation counts the records to enroll
+        without enrolling them
+        """
+        activity = self.create_server_action(
+            domain="[('id', '=', %s)]" % self.partner_01.id
+        )
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        wizard = (
+            self.env["automation.configuration.estimate"]
+            .with_context(default_configuration_id=self.configuration.id)
+            .create({})
+        )
+        self.assertEqual(2, wizard.record_count)
+        self.assertTrue(wizard.query_cost)
+        self.assertEqual(activity, wizard.step_ids.configuration_step_id)
+        self.assertEqual(1, wizard.step_ids.record_count)
+        self.assertTrue(wizard.step_ids.scheduled_date)
+        self.assertFalse(
+            self.env["automation.record"].search(
+                [("configuration_id", "=", self.configuration.id)]
+            )
+        )
+
     def test_is_test_behavior(self):
         """
         We want to ensure that no mails are sent on tests
@@ -0,0 +1,72 @@
+# Copyright 2024 Dixmit
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import fields
+from odoo.tests import tagged
+
+from .common import AutomationTestCase
+
+
+@tagged("-standard", "automation_benchmark")
+class TestAutomationBenchmark(AutomationTestCase):
+    """
+    Check that the queries of the crons use the partial indexes on a big table.
+    It is not executed by default, use ``--test-tags automation_benchmark``.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        activity = cls.create_server_action()
+        record = cls.configuration._create_record(cls.partner_01)
+        cls.env.flush_all()
+        # One step out of a hundred is scheduled, the others are done
+        cls.env.cr.execute(
+            """
+            INSERT INTO automation_record_step (
+                record_id, configuration_step_id, state, scheduled_date, expiry_date
+            )
+            SELECT
+                %(record_id)s,
+                %(step_id)s,
+                CASE WHEN i %% 100 = 0 THEN 'scheduled' ELSE 'done' END,
+                now() at time zone 'UTC' - i * interval '1 minute',
+                now() at time zone 'UTC' + (i %% 1000) * interval '1 minute'
+            FROM generate_series(1, 1000000) AS i
+            """,
+            {"record_id": record.id, "step_id": activity.id},
+        )
+        cls.env.cr.execute("ANALYZE automation_record_step")
+
+    def _get_plan_indexes(self, query, params):
+        self.env.cr.execute("EXPLAIN (FORMAT JSON) " + query, params)
+        nodes = [self.env.cr.fetchone()[0][0]["Plan"]]
+        indexes = set()
+        while nodes:
+            node = nodes.pop()
+            if "Index Name" in node:
+                indexes.add(node["Index Name"])
+            nodes += node.get("Plans", [])
+        return indexes
+
+    def test_scheduled_steps_query(self):
+        """The claim of the due steps uses the scheduled index"""
+        self.assertIn(
+            "automation_record_step_scheduled_index",
+            self._get_plan_indexes(
+                *self.env["automation.record.step"]._get_claim_query(
+                    fields.Datetime.now(), 1000
+                )
+            ),
+        )
+
+    def test_expired_steps_query(self):
+        """The claim of the expired steps uses the expiry index"""
+        self.assertIn(
+            "automation_record_step_expiry_index",
+            self._get_plan_indexes(
+                *self.env["automation.record.step"]._get_claim_query(
+                    fields.Datetime.now(), 1000, date_field="expiry_date"
+                )
+            ),
+        )
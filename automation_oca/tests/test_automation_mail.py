@@ -1,6 +1,8 @@
 # Copyright 2024 Dixmit
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from unittest.mock import patch
+
 from odoo import tools
 from odoo.tests.common import Form, HttpCase
 
@@ -63,6 +65,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         messages_01 = self.partner_01.message_ids
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -72,6 +75,127 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.assertEqual("sent", record_activity.mail_status)
         self.assertTrue(self.partner_01.message_ids - messages_01)
 
+    def test_activity_execution_batch(self):
+        """
+        We will check that all the mails of a step are sent at once
+        and that each mail is linked to its own step
+        """
+        activity = self.create_mail_activity()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        with self.mock_mail_gateway():
+            self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
+            self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
+            self.assertSentEmail(self.env.user.partner_id, [self.partner_02])
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(2, len(record_activities))
+        self.assertEqual({"done"}, set(record_activities.mapped("state")))
+        self.assertEqual({"sent"}, set(record_activities.mapped("mail_status")))
+        self.assertTrue(all(record_activities.mapped("message_id")))
+        self.assertEqual(2, len(set(record_activities.mapped("message_id"))))
+
+    def test_activity_execution_batch_error(self):
+        """
+        We will check that the mails of a failing batch are neither sent nor
+        sent again, and that their steps are set on error
+        """
+        activity = self.create_mail_activity()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        with self.mock_mail_gateway(), patch.object(
+            type(self.env["automation.record.step"]),
+            "_run_mail_composer",
+            side_effect=ValueError("Batch error"),
+        ):
+            self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
+            self.assertNotSentEmail()
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual({"error"}, set(record_activities.mapped("state")))
+        self.assertTrue(all(record_activities.mapped("error_trace")))
+        self.assertFalse(any(record_activities.mapped("mail_status")))
+
+    def test_mail_queued(self):
+        """
+        Mails are queued by the steps and sent by the mail queue
+        """
+        activity = self.create_mail_activity()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        with self.mock_mail_gateway():
+            self.env["automation.record.step"]._cron_automation_steps()
+            self.assertNotSentEmail()
+        record_activity = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        mail = self.env["mail.mail"].search(
+            [("automation_record_step_id", "=", record_activity.id)]
+        )
+        self.assertEqual("outgoing", mail.state)
+        self.assertEqual(record_activity.message_id, mail.message_id)
+
+    def test_mail_funnel(self):
+        """
+        The funnel of the mails is counted on the configuration step
+        """
+        activity = self.create_mail_activity()
+        self.configuration.editable_domain = "[('id', 'in', [%s, %s])]" % (
+            self.partner_01.id,
+            self.partner_02.id,
+        )
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        with self.mock_mail_gateway():
+            self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
+        record_activities = self.env["automation.record.step"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(2, activity.mail_sent_count)
+        self.assertEqual(0, activity.mail_open_count)
+        record_activities[0]._set_mail_open()
+        record_activities[0]._set_mail_clicked()
+        record_activities[0]._set_mail_reply()
+        # Events are only counted once
+        record_activities[0]._set_mail_open()
+        record_activities[1]._set_mail_bounced()
+        activity.invalidate_recordset()
+        self.assertEqual(2, activity.mail_sent_count)
+        self.assertEqual(1, activity.mail_open_count)
+        self.assertEqual(1, activity.mail_click_count)
+        self.assertEqual(1, activity.mail_reply_count)
+        self.assertEqual(1, activity.mail_bounce_count)
+        self.assertEqual(50.0, activity.mail_open_rate)
+        self.assertEqual(50.0, activity.mail_bounce_rate)
+        self.env["automation.configuration.stat"]._cron_compact()
+        activity.invalidate_recordset()
+        self.assertEqual(1, activity.mail_open_count)
+        self.assertEqual(1, activity.mail_bounce_count)
+        stats = self.env["automation.step.stat.daily"].search(
+            [("configuration_step_id", "=", activity.id)]
+        )
+        self.assertEqual(1, len(stats))
+        self.assertEqual(self.configuration, stats.configuration_id)
+        self.env["automation.step.stat.daily"]._reconcile(activity.ids)
+        activity.invalidate_recordset()
+        self.assertEqual(2, activity.mail_sent_count)
+        self.assertEqual(1, activity.mail_open_count)
+        self.assertEqual(1, activity.mail_bounce_count)
+
     def test_bounce(self):
         """
         Now we will check the execution of scheduled activities"""
@@ -84,6 +208,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -123,6 +248,33 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
             ]
         )
 
+    def test_search_by_message_ids(self):
+        """
+        We will check that steps are found by the Message-ID of their mail
+        """
+        self.create_mail_activity()
+        self.configuration.editable_domain = "[('id', '=', %s)]" % self.partner_01.id
+        self.configuration.start_automation()
+        self.env["automation.configuration"].cron_automation()
+        with self.mock_mail_gateway():
+            self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
+        record_activity = self.env["automation.record.step"].search(
+            [("configuration_step_id.configuration_id", "=", self.configuration.id)]
+        )
+        self.assertTrue(record_activity.message_id)
+        self.assertEqual(
+            record_activity,
+            self.env["automation.record.step"]._search_by_message_ids(
+                [" %s\n" % record_activity.message_id, ""]
+            ),
+        )
+        self.assertFalse(
+            self.env["automation.record.step"]._search_by_message_ids(
+                [tools.generate_tracking_message_id("MailTest")]
+            )
+        )
+
     def test_reply(self):
         """
         Now we will check the execution of scheduled activities"""
@@ -135,6 +287,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -181,6 +334,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -213,6 +367,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -256,6 +411,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -285,6 +441,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -311,6 +468,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -344,6 +502,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -437,6 +596,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -486,6 +646,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
@@ -515,6 +676,7 @@ class TestAutomationMail(AutomationTestCase, MockEmail, HttpCase):
         self.env["automation.configuration"].cron_automation()
         with self.mock_mail_gateway():
             self.env["automation.record.step"]._cron_automation_steps()
+            self.env["mail.mail"].process_email_queue()
             self.assertSentEmail(self.env.user.partner_id, [self.partner_01])
         record_activity = self.env["automation.record.step"].search(
             [("configuration_step_id", "=", activity.id)]
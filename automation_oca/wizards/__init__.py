@@ -1,2 +1,3 @@
 from . import mail_compose_message
 from . import automation_configuration_test
+from . import automation_configuration_estimate
@@ -0,0 +1,57 @@
+# Copyright 2024 Dixmit
+# License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
+
+from odoo import api, fields, models
+
+
+class AutomationConfigurationEstimate(models.TransientModel):
+
+    _name = "automation.configuration.estimate"
+    _description = "Estimate automation configuration enrollment"
+
+    configuration_id = fields.Many2one(
+        "automation.configuration", required=True, readonly=True
+    )
+    record_count = fields.Integer(string="Records to enroll", readonly=True)
+    query_cost = fields.Float(
+        readonly=True, help="Cost of the enrollment query estimated by the database"
+    )
+    step_ids = fields.One2many(
+        "automation.configuration.estimate.step", inverse_name="estimate_id"
+    )
+
+    @api.model
+    def default_get(self, fields_list):
+        result = super().default_get(fields_list)
+        if result.get("configuration_id"):
+            estimate = (
+                self.env["automation.configuration"]
+                .browse(result["configuration_id"])
+                ._get_enrollment_estimate()
+            )
+            result.update(
+                record_count=estimate["record_count"],
+                query_cost=estimate["query_cost"],
+                step_ids=[(0, 0, step) for step in estimate["steps"]],
+            )
+        return result
+
+
+class AutomationConfigurationEstimateStep(models.TransientModel):
+
+    _name = "automation.configuration.estimate.step"
+    _description = "Estimate automation configuration enrollment steps"
+
+    estimate_id = fields.Many2one(
+        "automation.configuration.estimate", required=True, ondelete="cascade"
+    )
+    configuration_step_id = fields.Many2one(
+        "automation.configuration.step", readonly=True
+    )
+    record_count = fields.Integer(
+        string="Matching records",
+        readonly=True,
+        help="Records to enroll that currently match the domain of the step",
+    )
+    scheduled_date = fields.Datetime(readonly=True)
+    expiry_date = fields.Datetime(readonly=True)
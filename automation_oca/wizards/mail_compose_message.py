@@ -9,6 +9,7 @@ class MailComposeMessage(models.TransientModel):
     _inherit = "mail.compose.message"
 
     automation_record_step_id = fields.Many2one("automation.record.step")
+    automation_record_step_ids = fields.Many2many("automation.record.step")
 
     def get_mail_values(self, res_ids):
         result = super().get_mail_values(res_ids)
@@ -17,4 +18,12 @@ class MailComposeMessage(models.TransientModel):
                 result[res_id][
                     "automation_record_step_id"
                 ] = self.automation_record_step_id.id
+        if self.automation_record_step_ids:
+            step_map = {
+                step.record_id.res_id: step.id
+                for step in self.automation_record_step_ids
+            }
+            for res_id in res_ids:
+                if res_id in step_map:
+                    result[res_id]["automation_record_step_id"] = step_map[res_id]
         return result